@@ -0,0 +1,101 @@
+"""A local stand-in for the Telegram Bot API that accepts every call."""
+import json
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT = {'id': 1, 'is_bot': True, 'first_name': 'InfoBot', 'username': 'info_bot'}
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    """ Answers calls of the bot api like telegram would, after a configurable latency.
+    Counts the calls by method and keeps the texts sent to each chat.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        super().__init__(('127.0.0.1', port), FakeBotApiHandler)
+        self.latency = latency
+        self.calls = Counter()
+        self.sent = {}
+        # handed out by getUpdates until a later offset confirms them
+        self.updates = []
+        self._lock = threading.Lock()
+        self._message_id = 0
+
+    @property
+    def url(self) -> str:
+        """The base url to pass to the bot"""
+        return f'http://127.0.0.1:{self.server_address[1]}/bot'
+
+    def start(self) -> 'FakeBotApi':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def call(self, method: str, params: dict):
+        with self._lock:
+            self.calls[method] += 1
+            self._message_id += 1
+            message_id = self._message_id
+            if 'text' in params:
+                self.sent.setdefault(str(params.get('chat_id')), []).append(params['text'])
+
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 1)), 'type': 'private'},
+            'from': BOT,
+            'text': params.get('text', ''),
+        }
+        if method == 'getMe':
+            return BOT
+        if method == 'sendMediaGroup':
+            media = params['media']
+            return [message for _ in (json.loads(media) if isinstance(media, str) else media)]
+        if method.startswith(('send', 'edit')):
+            return message
+        if method == 'getUpdates':
+            with self._lock:
+                offset = int(params.get('offset') or 0)
+                self.updates = [u for u in self.updates if u['update_id'] >= offset]
+                return self.updates[:int(params.get('limit') or 100)]
+        return True
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    server: FakeBotApi
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which would otherwise wait for delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, *_):
+        pass
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        method = self.path.rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            params = json.loads(body or b'{}')
+        elif content_type.startswith('multipart/form-data'):
+            form = BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+            params = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True).decode()
+                      for part in form.get_payload()}
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+        response = json.dumps({'ok': True, 'result': self.server.call(method, params)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
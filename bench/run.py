@@ -0,0 +1,156 @@
+"""
+Drives the handlers of the bot against local stand-ins of the OpenMensa api and the Bot API
+at increasing concurrency and reports latency, throughput and upstream calls per command.
+
+Usage: python -m bench.run [--latency 0.05] [--requests 200] [--concurrency 1 4 16 64]
+"""
+import argparse
+import itertools
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from telegram import Update
+from telegram.ext import CallbackContext, Updater
+
+from src.modules import menu, openmensa, plugins, url
+from src.modules.features import mensa, opal
+from src.modules.store import Store
+
+from .fake_bot_api import FakeBotApi
+from .stub_openmensa import StubOpenMensa
+
+USER = {'id': 1000, 'is_bot': False, 'first_name': 'Test'}
+_ids = itertools.count(1)
+
+
+def message(text: str, chat_id: int) -> dict:
+    command = text.split()[0]
+    return {
+        'message_id': next(_ids),
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': dict(USER, id=chat_id),
+        'text': text,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}] if command[0] == '/' else [],
+    }
+
+
+def command(text: str) -> Callable[[int], dict]:
+    return lambda chat_id: {'update_id': next(_ids), 'message': message(text, chat_id)}
+
+
+def button(data: str, text: str) -> Callable[[int], dict]:
+    return lambda chat_id: {'update_id': next(_ids), 'callback_query': {
+        'id': str(next(_ids)), 'from': dict(USER, id=chat_id), 'chat_instance': str(chat_id), 'data': data,
+        'message': message(text, chat_id),
+    }}
+
+
+def inline(query: str) -> Callable[[int], dict]:
+    return lambda chat_id: {'update_id': next(_ids), 'inline_query': {
+        'id': str(next(_ids)), 'from': dict(USER, id=chat_id), 'query': query, 'offset': '',
+    }}
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class Bench:
+    def __init__(self, stub: StubOpenMensa, bot_api: FakeBotApi, concurrency: int):
+        self.stub = stub
+        self.bot_api = bot_api
+        self.updater = Updater(token='123456:bench', base_url=bot_api.url, workers=1,
+                               request_kwargs={'con_pool_size': concurrency + 4})
+
+        mensa.url_mensa = stub.url + '/openmensa/v2'
+        mensa.store_path = ':memory:'
+        opal.url_opal = stub.url + '/opal/'
+
+        self.scenarios: Dict[str, tuple] = {
+            'mensa': (plugins.registry['mensa'].lazy('command_canteen'), command('/mensa alte-mensa morgen')),
+            'mensa-miss': (plugins.registry['mensa'].lazy('command_canteen'), command('/mensa xyz')),
+            'inline': (plugins.registry['mensa'].lazy('inline_canteen'), inline('alte-mensa morgen')),
+            'opal': (plugins.registry['opal'].lazy('command_opal'), command('/check_opal')),
+            'button': (plugins.route_callback, button(plugins.callback_data('opal', '0'), 'Soll ...?')),
+        }
+
+    def reset(self):
+        """Forgets everything cached, so every level starts cold"""
+        openmensa.cache.clear()
+        if openmensa.store is not None:
+            openmensa.store.close()
+        openmensa.store = Store(':memory:')
+        openmensa.canteen_index.update([])
+        menu.render.cache_clear()
+        menu.photos.cache_clear()
+        menu.inline_results.cache_clear()
+        url._probes.clear()
+
+    def handle(self, handler: Callable, make_update: Callable[[int], dict], chat_id: int) -> float:
+        update = Update.de_json(make_update(chat_id), self.updater.bot)
+        context = CallbackContext.from_update(update, self.updater.dispatcher)
+        if update.message is not None:
+            context.args = update.message.text.split()[1:]
+
+        start = time.perf_counter()
+        handler(update, context)
+        return time.perf_counter() - start
+
+    def run(self, name: str, requests: int, concurrency: int) -> dict:
+        handler, make_update = self.scenarios[name]
+        self.reset()
+        upstream, bot_calls = Counter(self.stub.calls), Counter(self.bot_api.calls)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda i: self.handle(handler, make_update, 1000 + i), range(requests)))
+        elapsed = time.perf_counter() - start
+
+        return {
+            'command': name,
+            'concurrency': concurrency,
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'throughput': requests / elapsed,
+            'upstream': sum((self.stub.calls - upstream).values()) / requests,
+            'bot_api': sum((self.bot_api.calls - bot_calls).values()) / requests,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the upstream servers take to answer')
+    parser.add_argument('--bot-latency', type=float, default=0.01, help='seconds the bot api takes to answer')
+    parser.add_argument('--canteens', type=int, default=20)
+    parser.add_argument('--meals', type=int, default=12, help='meals per canteen and day')
+    parser.add_argument('--requests', type=int, default=200, help='requests per command and concurrency')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--commands', nargs='+', default=None, help='only run these commands')
+    args = parser.parse_args()
+    # the handlers log every request, which would drown the report
+    logging.basicConfig(level=logging.ERROR)
+
+    stub = StubOpenMensa(latency=args.latency, canteens=args.canteens, meals=args.meals).start()
+    bot_api = FakeBotApi(latency=args.bot_latency).start()
+    bench = Bench(stub, bot_api, max(args.concurrency))
+    try:
+        print(f'{"command":<12}{"conc":>6}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}'
+              f'{"upstream":>10}{"bot api":>10}')
+        for name in args.commands or bench.scenarios:
+            for concurrency in args.concurrency:
+                r = bench.run(name, args.requests, concurrency)
+                print(f'{r["command"]:<12}{r["concurrency"]:>6}{r["p50"]:>10.1f}{r["p95"]:>10.1f}{r["p99"]:>10.1f}'
+                      f'{r["throughput"]:>10.1f}{r["upstream"]:>10.2f}{r["bot_api"]:>10.2f}', flush=True)
+    finally:
+        stub.stop()
+        bot_api.stop()
+
+
+if __name__ == '__main__':
+    main()
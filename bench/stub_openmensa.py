@@ -0,0 +1,163 @@
+"""A local stand-in for the OpenMensa v2 api of the Studentenwerk Dresden and the opal portal."""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+IMAGE = '//static.studentenwerk-dresden.de/bilder/mensen/studentenwerk-dresden-lieber-mensen-gehen.jpg'
+CATEGORIES = ['Pasta', 'Suppen', 'Wok', 'Grill', 'Dessert']
+NOTES = ['vegan', 'vegetarisch', 'enthält Gluten', 'scharf']
+
+
+class StubOpenMensa(ThreadingHTTPServer):
+    """ Serves generated canteens, days and meals with a configurable latency.
+    Every request is counted by the kind of resource it asked for.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port: int = 0, latency: float = 0.0, canteens: int = 20, meals: int = 12, days: int = 14):
+        """
+        :param port: 0 to pick a free port
+        :param latency: Seconds every response is delayed
+        :param canteens: Number of canteens
+        :param meals: Number of meals per canteen and day
+        :param days: Number of days from today on
+        """
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.meals = meals
+        self.days = days
+        self.opal_status = 200
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.canteens = [{
+            'id': i,
+            'name': 'Alte Mensa' if i == 1 else f'Mensa {i}',
+            'city': 'Dresden',
+            'address': f'Musterstraße {i}',
+            'coordinates': [51.03 + i / 1000, 13.73 + i / 1000] if i % 5 else None,
+        } for i in range(1, canteens + 1)]
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def count(self, kind: str):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def start(self) -> 'StubOpenMensa':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def day(self, day: date) -> dict:
+        return {'date': day.isoformat(), 'closed': day.weekday() >= 5}
+
+    def day_list(self, start: date) -> list:
+        # like the real api, the list starts before the requested day
+        first = start - timedelta(days=1)
+        return [self.day(first + timedelta(days=i)) for i in range(self.days + 1)]
+
+    def meal(self, canteen_id: int, day: date, i: int) -> dict:
+        return {
+            'id': canteen_id * 100000 + day.toordinal() % 1000 * 100 + i,
+            'name': f'Gericht {i} der {canteen_id}. Mensa am {day.isoformat()}',
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'notes': NOTES[:i % len(NOTES)],
+            'prices': {'Studierende': 2.0 + i / 10, 'Bedienstete': 4.0 + i / 10},
+            'image': IMAGE if i % 3 else f'//static.studentenwerk-dresden.de/bilder/{canteen_id}-{i}.jpg',
+            'url': f'https://www.studentenwerk-dresden.de/mensen/speiseplan/details-{canteen_id}-{i}.html',
+        }
+
+    def resolve(self, path: str, query: dict) -> Optional[object]:
+        """Returns the json for a path below /openmensa/v2 or None if there is nothing"""
+        if path in ('', '/'):
+            self.count('index')
+            return {'api': 'OpenMensa API Version 2'}
+        if path == '/canteens':
+            self.count('canteens')
+            canteens = self.canteens
+            if 'ids' in query:
+                canteens = [c for c in canteens if str(c['id']) in query['ids']]
+            if query.get('hasCoordinates') == ['True']:
+                canteens = [c for c in canteens if c['coordinates'] is not None]
+            return canteens
+
+        match = re.fullmatch(r'/canteens/(\d+)(/days(?:/([\d-]+)(/meals(?:/(\d+))?)?)?)?', path)
+        if match is None or not 1 <= int(match[1]) <= len(self.canteens):
+            return None
+        canteen_id = int(match[1])
+        if match[2] is None:
+            self.count('canteen')
+            return self.canteens[canteen_id - 1]
+        if match[3] is None:
+            self.count('days')
+            start = date.fromisoformat(query.get('start', [date.today().isoformat()])[0])
+            return self.day_list(start)
+
+        day = date.fromisoformat(match[3])
+        if match[4] is None:
+            self.count('day')
+            # single days use the key day instead of date
+            d = self.day(day)
+            return {'day': d['date'], 'closed': d['closed']}
+
+        self.count('meals')
+        meals = [] if self.day(day)['closed'] else [self.meal(canteen_id, day, i) for i in range(self.meals)]
+        if match[5] is None:
+            return meals
+        return next((m for m in meals if m['id'] == int(match[5])), None)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubOpenMensa
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which would otherwise wait for delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, *_):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+
+        if url.path.startswith('/opal'):
+            self.server.count('opal')
+            self.respond(self.server.opal_status, b'<html>Opal</html>', 'text/html')
+            return
+
+        if not url.path.startswith('/openmensa/v2'):
+            self.respond(404, b'{}')
+            return
+        data = self.server.resolve(url.path[len('/openmensa/v2'):], parse_qs(url.query))
+        if data is None:
+            self.respond(404, b'{"error": "not found"}')
+            return
+
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.respond(304, b'', etag=etag)
+        else:
+            self.respond(200, body, etag=etag)
+
+    def respond(self, status: int, body: bytes, content_type: str = 'application/json', etag: Optional[str] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
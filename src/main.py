@@ -1,186 +1,165 @@
 #!/usr/bin/env python
 
-from datetime import date, timedelta
+import importlib
 import logging
-from typing import List
+import signal
+import threading
+import time
 
-from telegram.ext import Updater, Filters
-from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, CallbackContext
+import pytz
+from telegram.ext import Updater, Filters, Defaults, CommandHandler, MessageHandler
 from telegram.error import TelegramError, Unauthorized, BadRequest, TimedOut, ChatMigrated, NetworkError
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-import secret
-from modules import openmensa, url
+from modules import broadcast, metrics, net, plugins
+
+# registers the plugins, their modules are imported on first use
+importlib.import_module('modules.features')
 
 logger = logging.getLogger(__name__)
-urls = {'opal': 'https://bildungsportal.sachsen.de/opal/',
-        'mensa': 'https://api.studentenwerk-dresden.de/openmensa/v2'}
+# threads handling updates, each of them may keep a connection to every upstream server, workers in secret.py
+workers = 8
+timezone = pytz.timezone('Europe/Berlin')
+# seconds to wait for pending updates to be handled when stopping the bot
+drain_timeout = 30
+# where the server receiving updates listens if webhook_listen and webhook_port are not set in secret.py
+webhook = {'listen': '127.0.0.1', 'port': 8443}
 
-# fetch updates from telegram and pass them to the dispatcher
-updater = Updater(token=secret.token)
-dispatcher = updater.dispatcher
-jobs = updater.job_queue
+# created by setup
+updater: Updater = None
+start_time = 0.0
 
 
 def setup():
-    openmensa.url_canteen = urls['mensa']
+    global updater, start_time, workers
+    start_time = time.perf_counter()
+    # the token is only needed to run the bot, not to import this module
+    import secret
+    workers = getattr(secret, 'workers', workers)
 
     # create logs
     logging.basicConfig(
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         level=logging.INFO)
 
+    # the worker threads share the connections with the threads fetching resources concurrently for them
+    net.configure(pool_size=2 * workers)
+
+    # only these users may ask for /stats, prometheus may scrape the metrics if a port is given
+    metrics.admins.update(getattr(secret, 'admins', ()))
+    net.listeners.append(metrics.record_upstream)
+    if getattr(secret, 'metrics_port', None):
+        metrics.start_server(secret.metrics_port)
+
+    # fetch updates from telegram and pass them to the dispatcher
+    # handlers run in the worker threads, so slow commands do not block the others
+    updater = Updater(token=secret.token,
+                      workers=workers,
+                      base_url=getattr(secret, 'bot_api_url', None),
+                      defaults=Defaults(tzinfo=timezone, run_async=True))
+    dispatcher = updater.dispatcher
+
     # register handlers
     dispatcher.add_handler(
         CommandHandler(['start', 'help'], command_help))
-    dispatcher.add_handler(
-        CommandHandler('check_opal', command_opal))
-    dispatcher.add_handler(
-        CommandHandler('mensa', command_canteen))
-    dispatcher.add_handler(
-        CallbackQueryHandler(button))
+    plugins.add_handlers(dispatcher)
     dispatcher.add_handler(
         MessageHandler(Filters.command, command_unknown))
     dispatcher.add_error_handler(error)
 
+    plugins.add_jobs(updater.job_queue)
+    metrics.watch_job_queue(updater.job_queue)
+
 
 def main():
-    # start the bot
-    updater.start_polling()
-    updater.idle()
+    import secret
 
+    # start the bot
+    if getattr(secret, 'webhook', False):
+        start_webhook(**webhook_settings(secret))
+    else:
+        updater.start_polling()
+    logger.info(f'Started in {(time.perf_counter() - start_time) * 1000:.0f}ms.')
 
-def check_opal(context: CallbackContext):
-    """Checking opal periodically"""
-    logger.debug('Checking status of opal.')
-    if url.check_status(urls["opal"]):
-        logger.info('Opal is online')
-        context.bot.send_message(chat_id='598112141', text='Opal ist wieder online :tada:')
-        # FIXME check if this works
-        context.job.schedule_removal()
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        signal.signal(sig, lambda *_: stopped.set())
+    while not stopped.wait(1):
+        pass
+    stop()
+
+
+def webhook_settings(secret) -> dict:
+    """ Returns where the webhook listens and the url telegram posts updates to.
+    Raises a ValueError if the path is not set, anyone knowing it could post updates.
+    """
+    path = getattr(secret, 'webhook_path', None)
+    if not path:
+        raise ValueError('Set webhook_path in secret.py to a path only telegram knows')
+    url = getattr(secret, 'webhook_url', None)
+    if url is None and getattr(secret, 'bot_api_url', None) is None:
+        # telegram only posts to public https urls, the local address is only accepted by a local stand-in
+        raise ValueError('Set webhook_url in secret.py to the public url of the webhook')
+    return {'listen': getattr(secret, 'webhook_listen', webhook['listen']),
+            'port': getattr(secret, 'webhook_port', webhook['port']),
+            'path': path,
+            'url': url}
+
+
+def start_webhook(listen: str, port: int, path: str, url: str = None):
+    """ Handles the updates received while the bot was offline and starts the webhook.
+    Only telegram knows the secret path, so nobody else can post updates.
+    Without a public url, the local address is registered, only a local stand-in of the bot api accepts that.
+    """
+    # telegram does not hand out updates as long as a webhook is set
+    updater.bot.delete_webhook()
+    pending = queue_pending_updates()
+    logger.info(f'Queued {pending} pending updates.')
+
+    updater.start_webhook(listen=listen, port=port, url_path=path, webhook_url=url)
+    logger.info(f'Listening for updates on {listen}:{port}/{path}')
+
+
+def queue_pending_updates(batch_size: int = 100) -> int:
+    """Fetches pending updates in batches and queues them for the dispatcher"""
+    count = 0
+    offset = None
+    while True:
+        updates = updater.bot.get_updates(offset=offset, limit=batch_size, timeout=0)
+        if not updates:
+            return count
+        for u in updates:
+            updater.dispatcher.update_queue.put(u)
+        count += len(updates)
+        # the next call confirms the updates of this batch
+        offset = updates[-1].update_id + 1
+
+
+def stop():
+    """Stops receiving updates, waits for the pending ones to be handled and stops the bot"""
+    logger.info('Stopping the bot.')
+    # ends the polling loop and the webhook server, the dispatcher keeps running
+    updater.running = False
+    if updater.httpd is not None:
+        updater.httpd.shutdown()
+        updater.httpd = None
+
+    deadline = time.monotonic() + drain_timeout
+    while not updater.dispatcher.update_queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if not updater.dispatcher.update_queue.empty():
+        logger.warning(f'Dropping {updater.dispatcher.update_queue.qsize()} pending updates.')
+
+    # handlers that already started are finished by the dispatcher before it stops
+    updater.stop()
 
 
 # define handlers for commands
 
+@metrics.timed('handler_seconds', handler='command_help')
 def command_help(update, _):
     """Command to show what the bot can do."""
     logger.info('Executing command help.')
-    message = '/check_opal: Prüfe, ob Opal zur Zeit online ist. :books:'
-    message += '\n/mensa <name> <tag>: Schicke die aktuellen Speisen in der Mensa. :fork_and_knife:'
-    update.message.reply_text(message)
-
-
-def command_opal(update, _):
-    """Handler to check the status of opal"""
-    logger.info('Executing command opal.')
-
-    status = "online"
-    online = True
-    if not url.check_status(urls["opal"]):
-        logger.info('Opal is offline.')
-        status = "mal wieder offline"
-        online = False
-
-    update.message.reply_text(f"Opal ist zur Zeit {status}.")
-
-    if not online:
-        # if opal is down, ask to check periodical
-        keyboard = [
-            [
-                InlineKeyboardButton("Nein", callback_data='0'),
-                InlineKeyboardButton("Ja", callback_data='1')
-            ]
-        ]
-        update.message.reply_text(
-            'Soll eine Nachricht geschickt werden, ' +
-            'sobald Opal wieder online ist?',
-            reply_markup=InlineKeyboardMarkup(keyboard))
-
-
-def command_canteen(update, context):
-    """Handler to get current meals from the canteen"""
-    logger.info('Executing command mensa.')
-
-    # /mensa alte-mensa morgen
-
-    # get canteen
-    canteen = None
-    canteen_str = ''
-    if len(context.args) >= 1:
-        canteen_str = context.args[0].casefold()
-        canteens: List[openmensa.Canteen] = openmensa.get_canteens()
-
-        # search for a canteen that matches the user request
-        for c in canteens:
-            c_name = c.name.casefold().replace(' ', '-')
-            if canteen_str != '' and canteen_str in c_name:
-                canteen = openmensa.Canteen(c.id, c.name)
-                break
-    else:
-        logger.warning('No canteen provided')
-
-    # if no canteen could be found, provide buttons
-    if canteen is None:
-        logger.warning(f'No canteen matching {canteen_str} found.')
-        # TODO let the user select a canteen
-        update.message.reply_text(
-            'Mensa konnte nicht gefunden werden.\n' +
-            'Folgende Mensen sind verfügbar:\n\n' +
-            '\n'.join(map(str, [c.name.casefold().replace(' ', '-') for c in openmensa.get_canteens()]))
-        )
-        return
-
-    logger.info(f'Using canteen {canteen.name}')
-
-    # get day
-    if len(context.args) >= 2:
-        day_str = context.args[1].casefold()
-        if day_str in ['heute', 'today']:
-            day = date.today()
-        elif day_str in ['morgen', 'tomorrow']:
-            day = date.today() + timedelta(days=1)
-        else:
-            logger.info('Trying to parse provided string as iso format.')
-            try:
-                day = date.fromisoformat(day_str)
-            except ValueError as e:
-                logger.error(e)
-                update.message.reply_text('Das Datum hat ein ungültiges Format.')
-                return
-
-            if day < date.today():
-                logger.warning('Given date is in the past')
-                update.message.reply_text('Das Datum ist in der Vergangenheit.')
-    else:
-        logger.warning('No date provided. Using today.')
-        day = date.today()
-
-    logger.info(f'Using day {day.isoformat()}')
-
-    # get meals
-    meals = canteen.get_meals(day)
-
-    if canteen.get_day(day)['closed']:
-        logger.warning('Canteen is closed.')
-        day: date = canteen.get_next_day_opened()
-        update.message.reply_text(f'Die {canteen.name} ist leider geschlossen. '
-                                  f'Sie öffnet wieder am {day.strftime("%d.%m.%Y")}')
-        return
-
-    update.message.reply_text(f'Am {day.strftime("%d.%m.%Y")} hat die {canteen.name}:')
-    for meal in meals:
-        meal_name = meal['name']
-        meal_price = f"{meal['prices']['Studierende']}€ / {meal['prices']['Bedienstete']}€"
-        meal_url = meal['url']
-        # only provide non-standard photos
-        meal_photo = f"meal['image']" \
-            if meal['image'] != 'https://static.studentenwerk-dresden.de' \
-                                '/bilder/mensen/studentenwerk-dresden-lieber-mensen-gehen.jpg' \
-            else ''
-        # TODO markdown parsing  for url
-        # seems to be broken currently
-        message: str = f'{meal_name} ({meal_price})\n{meal_url}'
-        update.message.reply_text(message)
+    update.message.reply_text(plugins.help_text())
 
 
 def command_unknown(update, _):
@@ -190,32 +169,20 @@ def command_unknown(update, _):
     update.message.reply_text("Sorry, das hab ich nicht verstanden.")
 
 
-def button(update, _):
-    """Handler for button presses"""
-    query = update.callback_query
-    query.answer()
-    message = 'Unknown button'
-
-    # NOTE add button handlers here
-    # opal
-    if query.message.text == 'Soll eine Nachricht geschickt werden, sobald Opal wieder online ist?':
-        logger.debug('Got a response from opal buttons')
-        if query.data == '1':
-            message = 'Ich werde eine Nachricht schicken, sobald Opal wieder online ist.'
-            jobs.run_repeating(check_opal, interval=120, first=0)
-        else:
-            message = 'Ich schicke keine Nachricht, wenn Opal wieder online ist.'
-    query.edit_message_text(text=message)
-
-
-def error(_, context):
+def error(update, context):
     """Log errors caused by updates"""
+    # count the errors by the first class they are handled as below
+    kind = next((e.__name__ for e in (Unauthorized, BadRequest, TimedOut, NetworkError, ChatMigrated, TelegramError)
+                 if isinstance(context.error, e)), type(context.error).__name__)
+    metrics.inc('telegram_errors_total', error=kind)
+
     # TODO handle exceptions
     try:
         raise context.error
     except Unauthorized:
-        # remove update.message.chat_id from conversation list
-        pass
+        # the bot was blocked or removed from the chat, features keeping the chat forget it
+        if update is not None and update.effective_chat is not None:
+            broadcast.blocked(update.effective_chat.id)
     except BadRequest:
         # handle malformed requests
         pass
@@ -225,9 +192,10 @@ def error(_, context):
     except NetworkError:
         # handle other connection problems
         pass
-    except ChatMigrated:
-        pass
-        # the chat_id of a group has changed, use e.new_chat_id instead
+    except ChatMigrated as e:
+        # the chat_id of a group has changed, features keeping the chat use e.new_chat_id instead
+        if update is not None and update.effective_chat is not None:
+            broadcast.migrated(update.effective_chat.id, e.new_chat_id)
     except TelegramError:
         pass
         # handle all other telegram related errors
@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from telegram import Bot
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TelegramError, Unauthorized
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# called with the id of a chat that blocked the bot or was deleted
+on_blocked: List[Callable[[int], None]] = []
+# called with the old and the new id of a group that became a supergroup
+on_migrated: List[Callable[[int, int], None]] = []
+# shared by all features, so together they stay within the limits of telegram
+_broadcaster: Optional['Broadcaster'] = None
+_broadcaster_lock = threading.Lock()
+
+
+def blocked(chat_id: int):
+    """Tells every feature keeping chats that the bot can not write to the chat anymore"""
+    logger.info(f'Chat {chat_id} is not reachable anymore.')
+    for callback in on_blocked:
+        try:
+            callback(chat_id)
+        except Exception as e:
+            logger.error(f'Could not forget chat {chat_id}: {e}')
+
+
+def migrated(old_chat_id: int, new_chat_id: int):
+    """Tells every feature keeping chats that a chat has a new id"""
+    logger.info(f'Chat {old_chat_id} migrated to {new_chat_id}.')
+    for callback in on_migrated:
+        try:
+            callback(old_chat_id, new_chat_id)
+        except Exception as e:
+            logger.error(f'Could not migrate chat {old_chat_id}: {e}')
+
+
+class TokenBucket:
+    """ Allows rate events per second on average and bursts of up to capacity events.
+    Tokens are reserved in advance, so concurrent callers queue up fairly.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds to wait before it may be used"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class Broadcaster:
+    """ Sends messages to many chats in the background without exceeding the limits of telegram.
+    The messages for a chat are always sent by the same thread, so they arrive in order. Failed sends are retried
+    after network problems, chats that blocked the bot or migrated are reported to blocked and migrated.
+    """
+
+    def __init__(self,
+                 bot: Bot,
+                 rate: float = 30,
+                 chat_rate: float = 1,
+                 threads: int = 4,
+                 retries: int = 3,
+                 backoff: float = 1):
+        """
+        :param rate: Messages per second to all chats together
+        :param chat_rate: Messages per second to a single chat
+        :param threads: Messages sent at the same time, should cover the latency of the bot api
+        :param retries: Attempts after a timeout or network error
+        :param backoff: Seconds to wait before the first retry, doubled for every further one
+        """
+        self.bot = bot
+        self.retries = retries
+        self.backoff = backoff
+        self.chat_rate = chat_rate
+        self._bucket = TokenBucket(rate, capacity=rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # one queue per thread, the messages of a chat always go to the same one
+        self._queues: List[queue.Queue] = [queue.Queue() for _ in range(threads)]
+        self._lock = threading.Lock()
+        for i, messages in enumerate(self._queues):
+            threading.Thread(target=self._run, args=(messages,), name=f'broadcast-{i}', daemon=True).start()
+
+    def send(self, chat_id: int, texts: Sequence[str], **kwargs):
+        """Queues messages to a chat, kwargs are passed on to send_message"""
+        self._queues[hash(chat_id) % len(self._queues)].put((chat_id, texts, kwargs))
+
+    def join(self):
+        """Waits until every queued message was sent or given up on"""
+        for messages in self._queues:
+            messages.join()
+
+    def _wait(self, chat_id: int):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                # a few messages in a row are fine, so a menu split into several messages arrives at once
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=3)
+        time.sleep(max(self._bucket.reserve(), bucket.reserve()))
+
+    def _run(self, messages: queue.Queue):
+        while True:
+            chat_id, texts, kwargs = messages.get()
+            try:
+                for text in texts:
+                    chat_id = self._send(chat_id, text, kwargs)
+                    if chat_id is None:
+                        break
+            except Exception as e:
+                logger.error(f'Could not send to {chat_id}: {e}')
+            finally:
+                messages.task_done()
+                if not any(q.unfinished_tasks for q in self._queues):
+                    # the buckets of idle chats are full again anyway
+                    with self._lock:
+                        self._chat_buckets.clear()
+
+    def _send(self, chat_id: int, text: str, kwargs: dict):
+        """Sends a single message and returns the chat it was sent to, or None if the chat is not reachable"""
+        attempt = 0
+        while True:
+            self._wait(chat_id)
+            try:
+                self.bot.send_message(chat_id, text, **kwargs)
+                metrics.inc('broadcast_messages_total', result='sent')
+                return chat_id
+            except RetryAfter as e:
+                logger.warning(f'Flood limit reached, waiting {e.retry_after}s')
+                time.sleep(e.retry_after)
+            except ChatMigrated as e:
+                migrated(chat_id, e.new_chat_id)
+                chat_id = e.new_chat_id
+            except Unauthorized:
+                blocked(chat_id)
+                metrics.inc('broadcast_messages_total', result='failed')
+                return None
+            except BadRequest as e:
+                # retrying does not help
+                logger.error(f'Telegram rejected a message to {chat_id}: {e}')
+                metrics.inc('broadcast_messages_total', result='failed')
+                return chat_id
+            except NetworkError as e:
+                attempt += 1
+                if attempt > self.retries:
+                    logger.error(f'Giving up on a message to {chat_id}: {e}')
+                    metrics.inc('broadcast_messages_total', result='failed')
+                    return chat_id
+                delay = self.backoff * 2 ** (attempt - 1)
+                logger.warning(f'Could not send to {chat_id}, retrying in {delay:.0f}s: {e}')
+                time.sleep(delay)
+            except TelegramError as e:
+                logger.error(f'Could not send to {chat_id}: {e}')
+                metrics.inc('broadcast_messages_total', result='failed')
+                return chat_id
+
+
+def shared(bot: Bot) -> Broadcaster:
+    """The broadcaster of all features, created on first use"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = Broadcaster(bot)
+        return _broadcaster
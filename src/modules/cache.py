@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class Entry:
+    """A cached response together with the validators needed to revalidate it."""
+    __slots__ = ('value', 'expires', 'etag', 'last_modified')
+
+    def __init__(self,
+                 value: Any,
+                 expires: float,
+                 etag: Optional[str] = None,
+                 last_modified: Optional[str] = None):
+        self.value = value
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def validators(self) -> Dict[str, str]:
+        """Headers for a conditional request revalidating this entry."""
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """ Bounded in-memory cache. Entries expire after a ttl and the least recently used
+    entry is evicted once the cache is full. Expired entries are kept, so they can be
+    revalidated with a conditional request instead of being fetched again.
+    """
+
+    def __init__(self, maxsize: int = 512, clock=time.monotonic):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Entry]:
+        """Returns the entry for key, even if it is expired. Marks it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: Entry) -> bool:
+        return self.clock() < entry.expires
+
+    def put(self,
+            key: Hashable,
+            value: Any,
+            ttl: float,
+            etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> Entry:
+        entry = Entry(value, self.clock() + ttl, etag, last_modified)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def touch(self, key: Hashable, ttl: float):
+        """Marks an entry as fresh again, f.e. after the server answered with 304."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires = self.clock() + ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,90 @@
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Tuple
+
+from .openmensa import Canteen, Meal
+
+logger = logging.getLogger(__name__)
+
+# a meal with one of these notes is sold out
+SOLD_OUT_NOTES = ('ausverkauft', 'sold out')
+
+
+def is_sold_out(meal: Meal) -> bool:
+    return any(note.casefold() in SOLD_OUT_NOTES for note in meal.notes)
+
+
+@dataclass(frozen=True)
+class MenuDiff:
+    """What changed in the menu of a canteen on a day"""
+    __slots__ = ('canteen', 'day', 'added', 'removed', 'price_changed', 'sold_out')
+    canteen: Canteen
+    day: date
+    added: Tuple[Meal, ...]
+    removed: Tuple[Meal, ...]
+    # the meal before and after the change
+    price_changed: Tuple[Tuple[Meal, Meal], ...]
+    sold_out: Tuple[Meal, ...]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.price_changed or self.sold_out)
+
+
+def diff(canteen: Canteen, day: date, old: Tuple[Meal, ...], new: Tuple[Meal, ...]) -> MenuDiff:
+    """Compares two versions of a menu by the ids of their meals"""
+    before = {m.id: m for m in old}
+    after = {m.id: m for m in new}
+    both = [(before[m.id], m) for m in new if m.id in before]
+    return MenuDiff(
+        canteen, day,
+        added=tuple(m for m in new if m.id not in before),
+        removed=tuple(m for m in old if m.id not in after),
+        price_changed=tuple((o, n) for o, n in both if o.prices != n.prices),
+        sold_out=tuple(n for o, n in both if is_sold_out(n) and not is_sold_out(o)))
+
+
+class ChangeDetector:
+    """ Remembers a fingerprint of every menu it observes and the meals behind it.
+    Observing an unchanged menu only costs comparing the fingerprints,
+    a changed one is compared meal by meal and the difference is kept until it is taken.
+    The first observation of a menu is what later ones are compared to.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._menus: Dict[Tuple[str, date], Tuple[int, Tuple[Meal, ...]]] = {}
+        self._pending: List[MenuDiff] = []
+
+    def observe(self, canteen: Canteen, day: date, meals: Tuple[Meal, ...]):
+        key = (canteen.id, day)
+        fingerprint = hash(meals)
+        with self._lock:
+            known = self._menus.get(key)
+            self._menus[key] = (fingerprint, meals)
+            if known is None or known[0] == fingerprint:
+                return
+        changes = diff(canteen, day, known[1], meals)
+        if changes:
+            logger.info(f'The menu of {canteen.name} on {day.isoformat()} changed')
+            with self._lock:
+                self._pending.append(changes)
+
+    def take(self) -> List[MenuDiff]:
+        """Returns the changes observed since the last call"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def prune(self, before: date):
+        """Forgets the menus of days before the given one"""
+        with self._lock:
+            for key in [k for k in self._menus if k[1] < before]:
+                del self._menus[key]
+
+    def __len__(self):
+        return len(self._menus)
+
+
+detector = ChangeDetector()
@@ -0,0 +1,61 @@
+"""Declares the features of the bot. The modules implementing them are imported on their first use."""
+from datetime import time
+
+from telegram.ext import Filters
+
+from ..plugins import Plugin, register
+
+# seconds between two runs of the job polling the repositories that are due
+repo_poll_interval = 30
+
+register(Plugin(
+    'opal', '.opal', __name__,
+    commands={'check_opal': 'command_opal'},
+    callback='button',
+    budgets={'command_opal': 3},
+    help='/check_opal: Prüfe, ob Opal zur Zeit online ist. :books:'))
+
+register(Plugin(
+    'mensa', '.mensa', __name__,
+    commands={'mensa': 'command_canteen', 'suche': 'command_search', 'abo': 'command_subscribe',
+              'aenderungen': 'command_watch'},
+    inline='inline_canteen',
+    messages=[(Filters.location, 'location_canteen')],
+    jobs=[
+        # keep the canteen index up to date
+        ('refresh_canteens', 'run_repeating', {'interval': 6 * 60 * 60, 'first': 0}),
+        # load the menus of today and tomorrow early in the morning and regularly while the canteens are open
+        ('prefetch_menus', 'run_daily', {'time': time(6, 0)}),
+        ('prefetch_menus_while_open', 'run_repeating', {'interval': 5 * 60, 'first': 0}),
+        ('prune_store', 'run_daily', {'time': time(0, 5)}),
+        # the search answers from an index of the meals of the upcoming days
+        ('index_meals', 'run_repeating', {'interval': 3 * 60 * 60, 'first': 10}),
+        # the menus are delivered by one daily job per time of day
+        ('schedule_deliveries', 'run_once', {'when': 0}),
+    ],
+    setup='setup',
+    # after these seconds, the handlers answer with the last known data
+    budgets={'command_canteen': 3, 'inline_canteen': 2, 'location_canteen': 2, 'command_subscribe': 3,
+             'command_watch': 3},
+    help='/mensa <name> <tag>: Schicke die aktuellen Speisen in der Mensa. :fork_and_knife:\n'
+         '/mensa <name> woche oder <von>..<bis>: Schicke die Speisen mehrerer Tage.\n'
+         '/suche <begriff> <tag>: Finde Gerichte in allen Mensen, zum Beispiel /suche vegan morgen.\n'
+         '/abo <name> <uhrzeit>: Schicke jeden Tag die Speisen der Mensa, /abo <name> aus beendet das.\n'
+         '/aenderungen <name>: Sage Bescheid, wenn Gerichte ausverkauft sind oder sich ändern.\n'
+         'Teile deinen Standort, um die nächsten geöffneten Mensen zu finden.'))
+
+register(Plugin(
+    'repos', '.repos', __name__,
+    commands={'repo': 'command_repo'},
+    # each run polls the repositories that are due, so the polls are spread evenly
+    jobs=[('poll_repos', 'run_repeating', {'interval': repo_poll_interval, 'first': repo_poll_interval,
+                                           'context': repo_poll_interval})],
+    setup='setup',
+    budgets={'command_repo': 5},
+    help='/repo <besitzer>/<name> oder <url>: Sage Bescheid, wenn es neue Commits gibt, '
+         '/repo <name> aus beendet das. :computer:'))
+
+# only answers the users listed as admins in secret.py, so it is not in the help
+register(Plugin(
+    'stats', '.stats', __name__,
+    commands={'stats': 'command_stats'}))
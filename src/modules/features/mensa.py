@@ -0,0 +1,460 @@
+import logging
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Tuple
+
+import pytz
+import requests
+from telegram import InputMediaPhoto, ParseMode
+from telegram.ext import CallbackContext, Job, JobQueue
+
+from .. import broadcast, changes, net
+from .. import menu as menu_renderer
+from .. import openmensa
+from ..store import Store
+
+logger = logging.getLogger(__name__)
+
+url_mensa = 'https://api.studentenwerk-dresden.de/openmensa/v2'
+# canteens, days and meals are kept in this database across restarts
+store_path = 'openmensa.sqlite'
+# send the photos of meals as an album after the menu
+send_photos = True
+# seconds telegram may cache answers to inline queries
+inline_cache_time = 5 * 60
+# menus are only prefetched regularly while the canteens are open
+opening_hours = (time(10, 0), time(15, 0))
+timezone = pytz.timezone('Europe/Berlin')
+# longest range of days a single command may ask for
+max_days = 14
+# the search finds meals from today on this many days
+search_days = 7
+# a shared location is answered with at most this many canteens within this many km
+nearby_count = 5
+nearby_distance = 10
+
+# answer if neither the api nor the store know the menu
+UNAVAILABLE = 'Der Speiseplan ist gerade nicht erreichbar, versuche es bitte gleich noch einmal.'
+# one daily job per time of day subscribers want their menu at
+_deliveries: Dict[time, Job] = {}
+_lock = threading.Lock()
+
+
+def setup():
+    openmensa.url_canteen = url_mensa
+    openmensa.store = Store(store_path)
+    # answer right away, even before the first refresh of the index
+    openmensa.index_canteens(openmensa.store.canteens() or [])
+    # subscriptions of chats the bot can not write to anymore are useless
+    broadcast.on_blocked.append(lambda chat_id: openmensa.store.forget_chat(chat_id))
+    broadcast.on_migrated.append(lambda old, new: openmensa.store.migrate_chat(old, new))
+    # every fetch of meals is compared to the previous one
+    openmensa.meal_listeners.append(changes.detector.observe)
+
+
+def refresh_canteens(_: CallbackContext):
+    """Rebuilding the canteen index periodically"""
+    try:
+        openmensa.refresh_canteen_index()
+    except Exception as e:
+        logger.error(f'Could not refresh the canteen index: {e}')
+
+
+def prefetch_menus(context: CallbackContext):
+    """Loading the menus of today and tomorrow of all canteens and telling the watchers about changes"""
+    today = date.today()
+    logger.info('Prefetching menus.')
+    try:
+        openmensa.prefetch([today, today + timedelta(days=1)])
+    except Exception as e:
+        logger.error(f'Could not prefetch menus: {e}')
+    notify_changes(context)
+
+
+def notify_changes(context: CallbackContext):
+    """Sends what changed in the menus of today to the chats watching the canteens"""
+    today = date.today()
+    for menu_diff in changes.detector.take():
+        if menu_diff.day != today:
+            continue
+        chat_ids = openmensa.store.watchers(menu_diff.canteen.id)
+        if not chat_ids:
+            continue
+        # rendered once for all watchers
+        texts = menu_renderer.render_changes(menu_diff)
+        for chat_id in chat_ids:
+            broadcast.shared(context.bot).send(chat_id, texts, parse_mode=ParseMode.HTML,
+                                               disable_web_page_preview=True)
+        logger.info(f'Told {len(chat_ids)} chats about changes in {menu_diff.canteen.name}')
+
+
+def prune_store(_: CallbackContext):
+    """Removing past days and meals from the store, the search and the change detection"""
+    openmensa.store.prune(date.today())
+    openmensa.meal_index.prune(date.today())
+    changes.detector.prune(date.today())
+
+
+def index_meals(_: CallbackContext):
+    """Loading the meals of the upcoming days of all canteens into the search"""
+    today = date.today()
+    try:
+        openmensa.index_meals([today + timedelta(days=i) for i in range(search_days)])
+    except Exception as e:
+        logger.error(f'Could not index meals: {e}')
+
+
+def prefetch_menus_while_open(context: CallbackContext):
+    """Prefetching menus, but only while the canteens are open"""
+    if opening_hours[0] <= datetime.now(timezone).time() <= opening_hours[1]:
+        prefetch_menus(context)
+
+
+def command_canteen(update, context):
+    """Handler to get current meals from the canteen"""
+    logger.info('Executing command mensa.')
+
+    # /mensa alte-mensa morgen
+
+    # get canteen
+    canteen = None
+    canteen_str = ''
+    if len(context.args) >= 1:
+        canteen_str = context.args[0]
+        try:
+            canteen = openmensa.find_canteen(canteen_str)
+        except requests.RequestException as e:
+            # the index of the canteens has not been built yet
+            logger.error(f'Could not find the canteen: {e}')
+            update.message.reply_text(UNAVAILABLE)
+            return
+    else:
+        logger.warning('No canteen provided')
+
+    # if no canteen could be found, provide buttons
+    if canteen is None:
+        logger.warning(f'No canteen matching {canteen_str} found.')
+        # TODO let the user select a canteen
+        update.message.reply_text(
+            'Mensa konnte nicht gefunden werden.\n' +
+            'Folgende Mensen sind verfügbar:\n\n' +
+            openmensa.canteen_index.listing
+        )
+        return
+
+    logger.info(f'Using canteen {canteen.name}')
+
+    # get day or range of days
+    if len(context.args) >= 2:
+        try:
+            day, end = parse_range(context.args[1])
+        except ValueError as e:
+            logger.error(e)
+            update.message.reply_text('Das Datum hat ein ungültiges Format.')
+            return
+
+        if day < date.today():
+            logger.warning('Given date is in the past')
+            update.message.reply_text('Das Datum ist in der Vergangenheit.')
+    else:
+        logger.warning('No date provided. Using today.')
+        day = end = date.today()
+
+    if day != end:
+        reply_days(update, canteen, day, end)
+        return
+
+    logger.info(f'Using day {day.isoformat()}')
+
+    # get meals, the last known ones if the api does not answer in time
+    try:
+        with net.tracking_freshness() as freshness:
+            menu = openmensa.get_menu(canteen, day)
+    except requests.RequestException as e:
+        logger.error(f'Could not get the menu: {e}')
+        update.message.reply_text(UNAVAILABLE)
+        return
+
+    if menu.closed:
+        logger.warning('Canteen is closed.')
+        text = menu_renderer.render_closed(menu)
+        update.message.reply_text(f'{text}\n\n{menu_renderer.STALE}' if freshness.stale else text)
+        return
+
+    texts = menu_renderer.render(menu)
+    for text in menu_renderer.mark_stale(texts) if freshness.stale else texts:
+        update.message.reply_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+
+    photos = menu_renderer.photos(menu)
+    if send_photos and len(photos) == 1:
+        update.message.reply_photo(photos[0][0], caption=photos[0][1])
+    elif send_photos and photos:
+        # albums need at least two photos
+        update.message.reply_media_group([InputMediaPhoto(photo, caption=caption) for photo, caption in photos])
+
+
+def reply_days(update, canteen: openmensa.Canteen, start: date, end: date):
+    """Replies with the menus of a canteen on all days from start to end in as few messages as possible"""
+    if (end - start).days >= max_days:
+        update.message.reply_text(f'Bitte frage nach höchstens {max_days} Tagen auf einmal.')
+        return
+
+    logger.info(f'Using days {start.isoformat()} to {end.isoformat()}')
+    try:
+        with net.tracking_freshness() as freshness:
+            menus = tuple(openmensa.get_menus(canteen, start, end))
+    except requests.RequestException as e:
+        logger.error(f'Could not get the menus: {e}')
+        update.message.reply_text(UNAVAILABLE)
+        return
+
+    texts = menu_renderer.render_days(menus)
+    for text in menu_renderer.mark_stale(texts) if freshness.stale else texts:
+        update.message.reply_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+
+
+def parse_range(range_str: str) -> Tuple[date, date]:
+    """ Returns the first and last day meant by woche, by two days joined by .. like 2026-10-19..2026-10-23
+    or by a single day as understood by parse_day. Raises a ValueError for anything else.
+    """
+    if range_str.casefold() in ['woche', 'week']:
+        start = date.today()
+        if start.weekday() >= 5:
+            # on weekends, the coming week is meant
+            start += timedelta(days=7 - start.weekday())
+        return start, start + timedelta(days=6 - start.weekday())
+
+    first, separator, last = range_str.partition('..')
+    if not separator:
+        day = parse_day(range_str)
+        return day, day
+    start, end = parse_day(first), parse_day(last)
+    if end < start:
+        raise ValueError(f'{range_str} ends before it starts')
+    return start, end
+
+
+def parse_day(day_str: str) -> date:
+    """Returns the day meant by heute, morgen or an iso date. Raises a ValueError for anything else."""
+    day_str = day_str.casefold()
+    if day_str in ['heute', 'today']:
+        return date.today()
+    elif day_str in ['morgen', 'tomorrow']:
+        return date.today() + timedelta(days=1)
+    logger.info('Trying to parse provided string as iso format.')
+    return date.fromisoformat(day_str)
+
+
+def command_search(update, context):
+    """Handler to search the meals of all canteens, f.e. /suche vegan morgen"""
+    logger.info('Executing command search.')
+
+    args = list(context.args)
+    if not args:
+        update.message.reply_text('Wonach soll ich suchen? Zum Beispiel /suche vegan morgen')
+        return
+
+    # the last argument is a day or a range of days, if it can be parsed as one
+    start, end = date.today(), date.today() + timedelta(days=search_days - 1)
+    if len(args) >= 2:
+        try:
+            start, end = parse_range(args[-1])
+            args.pop()
+        except ValueError:
+            pass
+
+    query = ' '.join(args)
+    found = openmensa.meal_index.search(query, start, end)
+    logger.info(f'Found {len(found)} meals matching {query}')
+    for text in menu_renderer.render_search(query, found):
+        update.message.reply_text(text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+
+
+def location_canteen(update, _):
+    """Handler for shared locations, answers with the closest canteens that are open today"""
+    logger.info('Executing location mensa.')
+    location = update.message.location
+    today = date.today()
+
+    # open canteens first, then those whose status is not known yet, closed ones are left out
+    try:
+        nearby = openmensa.find_nearby((location.latitude, location.longitude), k=nearby_count * 2,
+                                       max_distance=nearby_distance)
+    except requests.RequestException as e:
+        logger.error(f'Could not find the canteens nearby: {e}')
+        update.message.reply_text(UNAVAILABLE)
+        return
+    ranked = []
+    for canteen, distance in nearby:
+        day = canteen.peek_day(today)
+        if day is None or not day.closed:
+            ranked.append((canteen, distance, None if day is None else True))
+    ranked.sort(key=lambda n: (n[2] is None, n[1]))
+
+    update.message.reply_text(menu_renderer.render_nearby(ranked[:nearby_count]), parse_mode=ParseMode.HTML)
+
+
+def command_subscribe(update, context):
+    """Handler for /abo <mensa> <uhrzeit> to get the menu every day, /abo <mensa> aus to stop"""
+    logger.info('Executing command subscribe.')
+    chat_id = update.effective_chat.id
+
+    if not context.args:
+        subscriptions = openmensa.store.subscriptions(chat_id=chat_id)
+        # the names are known from the last time the canteens were fetched, no matter how long ago
+        canteens = {c.id: c for c in openmensa.store.canteens() or ()}
+        lines = [f'• {canteens[c].name if c in canteens else c} um {at.strftime("%H:%M")}'
+                 for _, c, at in subscriptions]
+        update.message.reply_text('Du bekommst jeden Tag die Speisen von:\n' + '\n'.join(lines) if lines else
+                                  'Du hast noch keine Mensa abonniert. Zum Beispiel: /abo alte-mensa 11:00')
+        return
+
+    try:
+        canteen = openmensa.find_canteen(context.args[0])
+    except requests.RequestException as e:
+        logger.error(f'Could not find the canteen: {e}')
+        update.message.reply_text(UNAVAILABLE)
+        return
+    if canteen is None:
+        update.message.reply_text(
+            'Mensa konnte nicht gefunden werden.\n' +
+            'Folgende Mensen sind verfügbar:\n\n' +
+            openmensa.canteen_index.listing
+        )
+        return
+
+    if len(context.args) >= 2 and context.args[1].casefold() in ['aus', 'stop']:
+        openmensa.store.unsubscribe(chat_id, canteen.id)
+        update.message.reply_text(f'Ich schicke dir nicht mehr die Speisen der {canteen.name}.')
+        return
+
+    try:
+        at = parse_time(context.args[1]) if len(context.args) >= 2 else None
+    except ValueError as e:
+        logger.error(e)
+        at = None
+    if at is None:
+        update.message.reply_text('Wann soll ich dir die Speisen schicken? Zum Beispiel: /abo alte-mensa 11:00')
+        return
+
+    openmensa.store.subscribe(chat_id, canteen.id, at)
+    schedule_delivery(context.job_queue, at)
+    update.message.reply_text(f'Ich schicke dir ab jetzt jeden Tag um {at.strftime("%H:%M")} '
+                              f'die Speisen der {canteen.name}.')
+
+
+def command_watch(update, context):
+    """Handler for /aenderungen <mensa> to hear about changes of the menu of today, /aenderungen <mensa> aus stops"""
+    logger.info('Executing command watch.')
+    chat_id = update.effective_chat.id
+
+    try:
+        canteen = openmensa.find_canteen(context.args[0]) if context.args else None
+    except requests.RequestException as e:
+        logger.error(f'Could not find the canteen: {e}')
+        update.message.reply_text(UNAVAILABLE)
+        return
+    if canteen is None:
+        update.message.reply_text(
+            'Mensa konnte nicht gefunden werden. Zum Beispiel: /aenderungen alte-mensa\n' +
+            'Folgende Mensen sind verfügbar:\n\n' +
+            openmensa.canteen_index.listing
+        )
+        return
+
+    if len(context.args) >= 2 and context.args[1].casefold() in ['aus', 'stop']:
+        openmensa.store.unwatch(chat_id, canteen.id)
+        update.message.reply_text(f'Ich sage dir nicht mehr, wenn sich die Speisen der {canteen.name} ändern.')
+        return
+
+    openmensa.store.watch(chat_id, canteen.id)
+    update.message.reply_text(f'Ich sage dir Bescheid, wenn sich die Speisen der {canteen.name} heute ändern.')
+
+
+def parse_time(time_str: str) -> time:
+    """Returns the time of day meant by 11, 11:30 or 11.30. Raises a ValueError for anything else."""
+    hours, _, minutes = time_str.replace('.', ':').partition(':')
+    return time(int(hours), int(minutes or 0))
+
+
+def schedule_delivery(job_queue: JobQueue, at: time):
+    """Delivers the menus to everyone subscribed at the time of day, if that does not happen yet"""
+    with _lock:
+        if at not in _deliveries:
+            _deliveries[at] = job_queue.run_daily(deliver_menus, at, context=at, name=f'abo {at.strftime("%H:%M")}')
+
+
+def schedule_deliveries(context: CallbackContext):
+    """Scheduling the deliveries of all subscriptions, once after the start"""
+    for at in sorted({at for _, _, at in openmensa.store.subscriptions()}):
+        schedule_delivery(context.job_queue, at)
+
+
+def deliver_menus(context: CallbackContext):
+    """Sending the menu of today to everyone subscribed at this time of day"""
+    at: time = context.job.context
+    subscriptions = openmensa.store.subscriptions(at=at)
+    if not subscriptions:
+        with _lock:
+            _deliveries.pop(at, None)
+        context.job.schedule_removal()
+        return
+
+    chats: Dict[str, list] = {}
+    for chat_id, canteen_id, _ in subscriptions:
+        chats.setdefault(canteen_id, []).append(chat_id)
+
+    today = date.today()
+    canteens = {c.id: c for c in openmensa.get_canteens()}
+    for canteen_id, chat_ids in chats.items():
+        if canteen_id not in canteens:
+            logger.warning(f'Canteen {canteen_id} does not exist anymore')
+            continue
+        try:
+            menu = openmensa.get_menu(canteens[canteen_id], today)
+        except Exception as e:
+            logger.error(f'Could not deliver the menu of {canteens[canteen_id].name}: {e}')
+            continue
+        if menu.closed:
+            continue
+
+        # rendered once for all subscribers
+        texts = menu_renderer.render(menu)
+        for chat_id in chat_ids:
+            broadcast.shared(context.bot).send(chat_id, texts, parse_mode=ParseMode.HTML,
+                                               disable_web_page_preview=True)
+    logger.info(f'Queued the menus of {len(chats)} canteens for {len(subscriptions)} subscriptions')
+
+
+def inline_canteen(update, _):
+    """Handler for inline queries like @bot alte-mensa morgen"""
+    query = update.inline_query
+    args = query.query.split()
+    logger.info('Executing inline query mensa.')
+
+    try:
+        canteen = openmensa.find_canteen(args[0]) if args else None
+    except requests.RequestException as e:
+        logger.error(f'Could not find the canteen: {e}')
+        query.answer([], cache_time=0)
+        return
+    if canteen is None:
+        query.answer([], cache_time=inline_cache_time)
+        return
+
+    try:
+        day = parse_day(args[1]) if len(args) >= 2 else date.today()
+    except ValueError:
+        day = date.today()
+
+    try:
+        with net.tracking_freshness() as freshness:
+            menu = openmensa.get_menu(canteen, day)
+    except requests.RequestException as e:
+        logger.error(f'Could not get the menu: {e}')
+        query.answer([], cache_time=0)
+        return
+
+    # telegram should not keep answers with stale menus
+    results = menu_renderer.inline_results(menu)
+    query.answer(list(results), cache_time=0 if freshness.stale else inline_cache_time)
@@ -0,0 +1,61 @@
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from .. import broadcast, net, url
+from ..monitor import StatusMonitor
+from ..plugins import callback_data
+
+logger = logging.getLogger(__name__)
+
+url_opal = 'https://bildungsportal.sachsen.de/opal/'
+# probes opal for everyone waiting for it to come back online
+monitor = StatusMonitor('opal', lambda: url.check_status(url_opal), 'Opal ist wieder online :tada:')
+broadcast.on_blocked.append(monitor.unsubscribe)
+broadcast.on_migrated.append(monitor.migrate)
+
+
+def command_opal(update, _):
+    """Handler to check the status of opal"""
+    logger.info('Executing command opal.')
+
+    status = "online"
+    online = True
+    with net.tracking_freshness() as freshness:
+        if not url.check_status(url_opal):
+            logger.info('Opal is offline.')
+            status = "mal wieder offline"
+            online = False
+
+    if freshness.stale:
+        update.message.reply_text(f"Opal antwortet gerade nicht, zuletzt war es {status}.")
+    else:
+        update.message.reply_text(f"Opal ist zur Zeit {status}.")
+
+    if not online:
+        # if opal is down, ask to check periodical
+        keyboard = [
+            [
+                InlineKeyboardButton("Nein", callback_data=callback_data('opal', '0')),
+                InlineKeyboardButton("Ja", callback_data=callback_data('opal', '1'))
+            ]
+        ]
+        update.message.reply_text(
+            'Soll eine Nachricht geschickt werden, ' +
+            'sobald Opal wieder online ist?',
+            reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+def button(update, context, data: str):
+    """Handler for the buttons asking whether to notify once opal is online"""
+    query = update.callback_query
+    query.answer()
+    logger.debug('Got a response from opal buttons')
+
+    if data == '1':
+        message = 'Ich werde eine Nachricht schicken, sobald Opal wieder online ist.'
+        monitor.subscribe(context.job_queue, query.message.chat_id)
+    else:
+        message = 'Ich schicke keine Nachricht, wenn Opal wieder online ist.'
+        monitor.unsubscribe(query.message.chat_id)
+    query.edit_message_text(text=message)
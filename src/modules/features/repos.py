@@ -0,0 +1,103 @@
+import logging
+from html import escape
+from typing import List, Optional, Tuple
+
+import requests
+from telegram import ParseMode
+from telegram.ext import CallbackContext
+
+from .. import broadcast, repos
+from ..menu import split
+from ..repos import DEFAULT_BRANCH, FollowStore, RepoWatcher, Update, parse_repo
+
+logger = logging.getLogger(__name__)
+
+# keeps the followed repositories across restarts
+store_path = 'repos.sqlite'
+# polls every followed repository once per interval
+watcher: Optional[RepoWatcher] = None
+
+
+def setup():
+    global watcher
+    try:
+        import secret
+        repos.github_token = getattr(secret, 'github_token', None)
+    except ImportError:
+        logger.warning('There is no secret.py, github is asked without a token')
+    watcher = RepoWatcher(store=FollowStore(store_path))
+    logger.info(f'Following {len(watcher)} repositories')
+    broadcast.on_blocked.append(watcher.unfollow)
+    broadcast.on_migrated.append(watcher.migrate)
+
+
+def command_repo(update, context):
+    """Handler to follow a git repository, lists the followed ones without arguments"""
+    logger.info('Executing command repo.')
+    chat_id = update.effective_chat.id
+
+    if not context.args:
+        followed = watcher.following(chat_id)
+        if followed:
+            update.message.reply_text('Du folgst:\n' + '\n'.join(f'• {repo.name}' for repo in followed))
+        else:
+            update.message.reply_text('Du folgst keinem Repository, zum Beispiel mit /repo l0drex/TelegramInfoBot.')
+        return
+
+    try:
+        repo = parse_repo(context.args[0])
+    except ValueError:
+        update.message.reply_text('Gib ein Repository als <besitzer>/<name> oder als url an.')
+        return
+
+    if context.args[1:] == ['aus']:
+        watcher.unfollow(chat_id, repo)
+        update.message.reply_text(f'Ich sage nicht mehr Bescheid, wenn sich {repo.name} ändert.')
+        return
+
+    if repo not in watcher:
+        try:
+            # the first poll is what later ones are compared to
+            watcher.poll(repo)
+        except requests.RequestException as e:
+            if isinstance(e, requests.HTTPError) and e.response.status_code == 404:
+                update.message.reply_text(f'{repo.name} gibt es nicht.')
+                return
+            logger.warning(f'Could not poll {repo.name}: {e}')
+            update.message.reply_text(f'{repo.name} ist gerade nicht erreichbar, versuche es bitte später noch einmal.')
+            return
+    watcher.follow(chat_id, repo)
+    update.message.reply_text(f'Ich sage Bescheid, wenn es neue Commits in {repo.name} gibt.')
+
+
+def poll_repos(context: CallbackContext):
+    """ Polls the repositories that are due and sends each chat a single message about all of them
+    :param context: The context of its job are the seconds between two runs
+    """
+    batches = watcher.poll_due(context.job.context)
+    for chat_id, updates in batches.items():
+        broadcast.shared(context.bot).send(chat_id, render(updates), parse_mode=ParseMode.HTML,
+                                           disable_web_page_preview=True)
+    if batches:
+        logger.info(f'Told {len(batches)} chats about new commits')
+
+
+def render(updates: List[Update]) -> Tuple[str, ...]:
+    return split(map(render_update, updates))
+
+
+def render_update(update: Update) -> str:
+    title = f'<b>{escape(update.repo.name)}</b>'
+    if update.branch != DEFAULT_BRANCH:
+        title += f' ({escape(update.branch)})'
+    if update.after is None:
+        return f'{title}: Branch gelöscht'
+    lines = [f'Neu in {title}:' if update.before else f'Neuer Branch {title}:']
+    for commit in update.commits:
+        sha = escape(commit.sha[:7])
+        if commit.url:
+            sha = f'<a href="{escape(commit.url)}">{sha}</a>'
+        lines.append(f'• {sha} {escape(commit.message)} ({escape(commit.author)})')
+    if not update.commits:
+        lines.append(f'• {update.before[:7] + " → " if update.before else ""}{update.after[:7]}')
+    return '\n'.join(lines)
@@ -0,0 +1,35 @@
+import logging
+from html import escape
+
+from telegram import ParseMode
+
+from .. import metrics, plugins
+
+logger = logging.getLogger(__name__)
+
+
+def command_stats(update, context):
+    """ Handler showing the runtime metrics to admins.
+    /stats profile <handler> profiles the next call of the handler, /stats profile shows the results.
+    """
+    logger.info('Executing command stats.')
+    if update.effective_user is None or update.effective_user.id not in metrics.admins:
+        update.message.reply_text('Sorry, das hab ich nicht verstanden.')
+        return
+
+    args = context.args or []
+    if args[:1] == ['profile']:
+        if len(args) > 1:
+            metrics.profile_next(args[1])
+            update.message.reply_text(f'Der nächste Aufruf von {args[1]} wird profiliert.')
+        elif metrics.profiles:
+            # the ends of long profiles are cut off, they are complete in the log
+            text = '\n\n'.join(f'{name}:\n{profile}' for name, profile in metrics.profiles.items())
+            update.message.reply_text(f'<pre>{escape(text[:4000])}</pre>', parse_mode=ParseMode.HTML)
+        else:
+            update.message.reply_text('Es wurde noch nichts profiliert.')
+        return
+
+    loaded = ', '.join(f'{name} ({t * 1000:.0f}ms)' for name, t in plugins.import_times.items())
+    text = f'{metrics.render_summary()}\n\nGeladene Plugins: {loaded or "keine"}'
+    update.message.reply_text(f'<pre>{escape(text[:4000])}</pre>', parse_mode=ParseMode.HTML)
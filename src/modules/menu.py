@@ -0,0 +1,206 @@
+from datetime import date
+from functools import lru_cache
+from html import escape
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent, ParseMode
+
+from . import metrics
+from .changes import MenuDiff
+from .openmensa import Canteen, Found, Meal, Menu, slugify
+
+# longest text telegram accepts in a single message
+MESSAGE_LIMIT = 4096
+# telegram sends at most this many photos in one media group
+MEDIA_GROUP_LIMIT = 10
+# the studentenwerk uses this photo for all meals without an own one
+DEFAULT_IMAGE = 'https://static.studentenwerk-dresden.de/bilder/mensen/studentenwerk-dresden-lieber-mensen-gehen.jpg'
+# tells that a menu could not be refreshed in time
+STALE = 'Der Speiseplan konnte gerade nicht aktualisiert werden, das ist der letzte bekannte Stand.'
+# short names of the weekdays, starting on monday
+WEEKDAYS = ('Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So')
+
+
+def format_price(price: Optional[float]) -> str:
+    return '-' if price is None else f'{price:.2f}€'
+
+
+def render_meal(meal: Meal) -> str:
+    name = escape(meal.name)
+    if meal.url:
+        name = f'<a href="{escape(meal.url)}">{name}</a>'
+    return f'• {name} ({format_price(meal.prices.students)} / {format_price(meal.prices.employees)})'
+
+
+def group_by_category(meals: Iterable[Meal]) -> Dict[str, List[Meal]]:
+    """Groups meals by their category, keeping the order of the api"""
+    groups: Dict[str, List[Meal]] = {}
+    for meal in meals:
+        groups.setdefault(meal.category or 'Sonstiges', []).append(meal)
+    return groups
+
+
+def split(blocks: Iterable[str], limit: int = MESSAGE_LIMIT) -> Tuple[str, ...]:
+    """ Joins blocks of text into as few messages as possible.
+    Blocks that do not fit into one message are split between their lines.
+    """
+    messages = []
+    current = ''
+
+    def add(text: str, separator: str):
+        nonlocal current
+        if current and len(current) + len(separator) + len(text) <= limit:
+            current += separator + text
+            return
+        if current:
+            messages.append(current)
+        # a single line longer than the limit has to be cut
+        while len(text) > limit:
+            messages.append(text[:limit])
+            text = text[limit:]
+        current = text
+
+    for block in blocks:
+        if len(block) <= limit:
+            add(block, '\n\n')
+        else:
+            for line in block.split('\n'):
+                add(line, '\n')
+    if current:
+        messages.append(current)
+    return tuple(messages)
+
+
+@lru_cache(maxsize=256)
+def render(menu: Menu) -> Tuple[str, ...]:
+    """ Renders the meals of a menu as html, grouped by category, in as few messages as possible.
+    The result is cached, so a menu is rendered once no matter how many users ask for it.
+    """
+    blocks = [f'Am {menu.day.strftime("%d.%m.%Y")} hat die <b>{escape(menu.canteen.name)}</b>:']
+    for category, meals in group_by_category(menu.meals).items():
+        blocks.append(f'<b>{escape(category)}</b>\n' + '\n'.join(map(render_meal, meals)))
+    return split(blocks)
+
+
+@lru_cache(maxsize=256)
+def photos(menu: Menu) -> Tuple[Tuple[str, str], ...]:
+    """Returns url and caption of meals with a non-standard photo, as many as fit into one media group"""
+    meals = [m for m in menu.meals if m.image and m.image != DEFAULT_IMAGE]
+    return tuple((m.image, m.name) for m in meals[:MEDIA_GROUP_LIMIT])
+
+
+@lru_cache(maxsize=64)
+def render_days(menus: Tuple[Menu, ...]) -> Tuple[str, ...]:
+    """ Renders the menus of one canteen on several days compactly as html, in as few messages as possible.
+    Meals are not grouped by category and closed days are named in a single line.
+    """
+    blocks = [f'Die <b>{escape(menus[0].canteen.name)}</b> hat:' if menus else 'Keine Tage gefunden.']
+    closed = []
+    for menu in menus:
+        if menu.closed:
+            closed.append(format_day(menu.day))
+        else:
+            blocks.append(f'<b>{format_day(menu.day)}</b>\n' + '\n'.join(map(render_meal, menu.meals)))
+    if closed:
+        blocks.append('Geschlossen: ' + ', '.join(closed))
+    return split(blocks)
+
+
+def render_search(query: str, found: List[Found], limit: int = 100) -> Tuple[str, ...]:
+    """Renders the meals found for a query as html, grouped by day and canteen"""
+    if not found:
+        return (f'Keine Gerichte mit {escape(query)} gefunden.',)
+
+    blocks = [f'Gerichte mit <b>{escape(query)}</b>:']
+    days: Dict[date, Dict[str, List[Meal]]] = {}
+    for canteen, day, meal in found[:limit]:
+        days.setdefault(day, {}).setdefault(canteen.name, []).append(meal)
+    for day, canteens in days.items():
+        blocks.append(f'<b>{format_day(day)}</b>\n' + '\n'.join(
+            f'<i>{escape(name)}</i>\n' + '\n'.join(map(render_meal, meals)) for name, meals in canteens.items()))
+    if len(found) > limit:
+        blocks.append(f'... und {len(found) - limit} weitere. Grenze die Suche weiter ein.')
+    return split(blocks)
+
+
+def render_nearby(nearby: List[Tuple[Canteen, float, Optional[bool]]]) -> str:
+    """Renders canteens with their distance in km and whether they are open today, if that is known"""
+    if not nearby:
+        return 'In deiner Nähe hat heute keine Mensa geöffnet.'
+
+    lines = ['Mensen in deiner Nähe:']
+    for canteen, distance, opened in nearby:
+        status = 'geöffnet' if opened else 'Öffnungszeiten unbekannt'
+        lines.append(f'• <b>{escape(canteen.name)}</b> ({format_distance(distance)}, {status}) '
+                     f'/mensa {escape(slugify(canteen.name))}')
+    return '\n'.join(lines)
+
+
+def render_changes(diff: MenuDiff) -> Tuple[str, ...]:
+    """Renders what changed in a menu as html"""
+    blocks = [f'Neues aus der <b>{escape(diff.canteen.name)}</b> am {format_day(diff.day)}:']
+    if diff.sold_out:
+        blocks.append('<b>Ausverkauft</b>\n' + '\n'.join(f'• {escape(m.name)}' for m in diff.sold_out))
+    if diff.added:
+        blocks.append('<b>Neu</b>\n' + '\n'.join(map(render_meal, diff.added)))
+    if diff.price_changed:
+        blocks.append('<b>Neuer Preis</b>\n' + '\n'.join(
+            f'• {escape(new.name)} ({format_price(old.prices.students)} → {format_price(new.prices.students)} / '
+            f'{format_price(old.prices.employees)} → {format_price(new.prices.employees)})'
+            for old, new in diff.price_changed))
+    if diff.removed:
+        blocks.append('<b>Nicht mehr da</b>\n' + '\n'.join(f'• {escape(m.name)}' for m in diff.removed))
+    return split(blocks)
+
+
+def format_distance(distance: float) -> str:
+    return f'{distance * 1000:.0f} m' if distance < 1 else f'{distance:.1f} km'
+
+
+def format_day(day: date) -> str:
+    return f'{WEEKDAYS[day.weekday()]} {day.strftime("%d.%m.")}'
+
+
+def mark_stale(messages: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Puts a note in front of rendered html messages that they are not up to date"""
+    return split((f'<i>{STALE}</i>',) + messages)
+
+
+def render_closed(menu: Menu) -> str:
+    text = f'Die {menu.canteen.name} ist leider geschlossen.'
+    if menu.next_opened is not None:
+        text += f' Sie öffnet wieder am {menu.next_opened.strftime("%d.%m.%Y")}'
+    return text
+
+
+@lru_cache(maxsize=256)
+def inline_results(menu: Menu) -> Tuple[InlineQueryResultArticle, ...]:
+    """Answers to an inline query for a menu: the whole menu first, then every single meal"""
+    prefix = f'{menu.canteen.id}-{menu.day.isoformat()}'
+    title = f'{menu.canteen.name} am {menu.day.strftime("%d.%m.%Y")}'
+    if menu.closed:
+        return (InlineQueryResultArticle(f'{prefix}-closed', title, InputTextMessageContent(render_closed(menu)),
+                                         description='geschlossen'),)
+
+    results = [InlineQueryResultArticle(
+        f'{prefix}-menu', title,
+        InputTextMessageContent(render(menu)[0], parse_mode=ParseMode.HTML, disable_web_page_preview=True),
+        description=f'{len(menu.meals)} Gerichte')]
+    for meal in menu.meals:
+        results.append(InlineQueryResultArticle(
+            f'{prefix}-{meal.id}', meal.name,
+            InputTextMessageContent(render_meal(meal), parse_mode=ParseMode.HTML, disable_web_page_preview=True),
+            description=f'{format_price(meal.prices.students)} / {format_price(meal.prices.employees)}',
+            thumb_url=meal.image if meal.image != DEFAULT_IMAGE else None))
+    # telegram accepts at most 50 results
+    return tuple(results[:50])
+
+
+def _cache_samples():
+    for function in (render, render_days, photos, inline_results):
+        info = function.cache_info()
+        yield 'cache_hits_total', {'cache': function.__name__}, info.hits
+        yield 'cache_misses_total', {'cache': function.__name__}, info.misses
+
+
+metrics.collectors.append(_cache_samples)
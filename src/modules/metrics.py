@@ -0,0 +1,229 @@
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+# upper bounds of the buckets of all histograms in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+# telegram user ids allowed to see the statistics
+admins: Set[int] = set()
+# return additional samples, f.e. of caches, whenever metrics are rendered
+collectors: List[Callable[[], Iterable[Sample]]] = []
+# text of the last profile of each handler
+profiles: Dict[str, str] = {}
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the bucket containing the quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and seen > 0:
+                return bound
+        return 0.0
+
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Labels], float] = {}
+_histograms: Dict[Tuple[str, Labels], Histogram] = {}
+_armed: Set[str] = set()
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels: str):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels: str):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+@contextmanager
+def timer(name: str, **labels: str):
+    """Observes the seconds the block took"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name: str, **labels: str):
+    """Decorator observing the seconds each call took"""
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def histograms() -> Dict[Tuple[str, Labels], Histogram]:
+    with _lock:
+        return dict(_histograms)
+
+
+def counters() -> Dict[Tuple[str, Labels], float]:
+    with _lock:
+        counted = dict(_counters)
+    for collect in collectors:
+        for name, labels, value in collect():
+            counted[_key(name, labels)] = value
+    return counted
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def record_upstream(url: str, status: Optional[int], elapsed: float):
+    """Listener for modules.net, records every request sent upstream"""
+    host = urlparse(url).hostname or ''
+    observe('upstream_seconds', elapsed, host=host)
+    inc('upstream_requests_total', host=host, status=str(status) if status is not None else 'error')
+
+
+def watch_job_queue(job_queue):
+    """Records how late jobs start and how often they fail"""
+    from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_SUBMITTED
+
+    def listener(event):
+        if event.code == EVENT_JOB_SUBMITTED:
+            for scheduled in event.scheduled_run_times:
+                observe('job_lag_seconds', max(0.0, time.time() - scheduled.timestamp()))
+        else:
+            inc('job_errors_total')
+
+    job_queue.scheduler.add_listener(listener, EVENT_JOB_SUBMITTED | EVENT_JOB_ERROR)
+
+
+def profile_next(name: str):
+    """Profiles the next call of the handler, the result is kept in profiles"""
+    with _lock:
+        _armed.add(name)
+
+
+@contextmanager
+def profiled(name: str):
+    """Profiles the block if profile_next was called for name before"""
+    with _lock:
+        armed = name in _armed
+        _armed.discard(name)
+    if not armed:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(20)
+        profiles[name] = text.getvalue()
+        logger.info(f'Profile of {name}:\n{profiles[name]}')
+
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def render_prometheus() -> str:
+    """Returns all metrics in the text format of prometheus"""
+    lines = []
+    for (name, labels), value in sorted(counters().items()):
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), histogram in sorted(histograms().items(), key=lambda item: item[0]):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+            lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+        lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_summary() -> str:
+    """Returns a short overview meant to be read in a chat"""
+    lines = []
+    for (name, labels), histogram in sorted(histograms().items(), key=lambda item: item[0]):
+        label = ' '.join(v for _, v in labels)
+        lines.append(f'{name} {label}: n={histogram.count} avg={histogram.sum / histogram.count * 1000:.0f}ms '
+                     f'p50<={histogram.quantile(0.5) * 1000:.0f}ms p95<={histogram.quantile(0.95) * 1000:.0f}ms')
+    for (name, labels), value in sorted(counters().items()):
+        label = ' '.join(f'{k}={v}' for k, v in labels)
+        lines.append(f'{name} {label}: {value:g}')
+    return '\n'.join(lines) or 'Noch keine Daten.'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *_):
+        pass
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(port: int, address: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serves the metrics on http://address:port/metrics"""
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f'Serving metrics on http://{address}:{port}/metrics')
+    return server
@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import Callable, Optional, Set
+
+from telegram.ext import CallbackContext, Job, JobQueue
+
+from . import broadcast
+
+logger = logging.getLogger(__name__)
+
+
+class StatusMonitor:
+    """ Waits for a service to come back online and notifies everyone who subscribed.
+    There is only one probe per interval, no matter how many chats are waiting.
+    While the service stays down, the interval grows up to max_interval.
+    """
+
+    def __init__(self,
+                 name: str,
+                 check: Callable[[], bool],
+                 message: str,
+                 interval: float = 120,
+                 max_interval: float = 30 * 60,
+                 backoff: float = 1.5):
+        """
+        :param name: Used for logging and as name of the job
+        :param check: Returns whether the service is online
+        :param message: Sent to all subscribers once the service is online
+        :param interval: Seconds between the first probes
+        :param max_interval: Upper bound for the seconds between probes
+        :param backoff: Factor the interval grows by after each failed probe
+        """
+        self.name = name
+        self.check = check
+        self.message = message
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.subscribers: Set[int] = set()
+        self._current_interval = interval
+        self._job: Optional[Job] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._job is not None
+
+    def subscribe(self, job_queue: JobQueue, chat_id: int):
+        """Notifies the chat once the service is online again. Starts probing if necessary."""
+        with self._lock:
+            self.subscribers.add(chat_id)
+            if self._job is None:
+                logger.info(f'Starting to monitor {self.name}')
+                self._current_interval = self.interval
+                self._job = job_queue.run_once(self._probe, self.interval, name=self.name)
+
+    def unsubscribe(self, chat_id: int):
+        with self._lock:
+            self.subscribers.discard(chat_id)
+            if not self.subscribers and self._job is not None:
+                logger.info(f'Nobody is waiting for {self.name} anymore')
+                self._job.schedule_removal()
+                self._job = None
+
+    def migrate(self, old_chat_id: int, new_chat_id: int):
+        with self._lock:
+            if old_chat_id in self.subscribers:
+                self.subscribers.discard(old_chat_id)
+                self.subscribers.add(new_chat_id)
+
+    def _probe(self, context: CallbackContext):
+        logger.debug(f'Checking status of {self.name}.')
+        online = self.check()
+
+        with self._lock:
+            if context.job is not self._job:
+                # the monitor was stopped in the meantime
+                return
+            if not online:
+                self._current_interval = min(self._current_interval * self.backoff, self.max_interval)
+                logger.debug(f'{self.name} is still offline, checking again in {self._current_interval:.0f}s')
+                self._job = context.job_queue.run_once(self._probe, self._current_interval, name=self.name)
+                return
+
+            subscribers, self.subscribers = self.subscribers, set()
+            self._job = None
+
+        logger.info(f'{self.name} is online, notifying {len(subscribers)} chats')
+        for chat_id in subscribers:
+            broadcast.shared(context.bot).send(chat_id, [self.message])
@@ -0,0 +1,432 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+import yarl
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+Timeout = Tuple[float, float]
+T = TypeVar('T')
+
+# (connect, read) timeout in seconds used if a request does not set its own
+timeout: Timeout = (3.05, 10)
+session = requests.Session()
+# used for requests with a latency budget, does not retry
+budget_session = requests.Session()
+# failed requests are retried this often, with an exponential delay starting at retry_backoff seconds
+max_retries = 2
+retry_backoff = 0.3
+# these status codes are retried as well
+RETRY_STATUSES = (502, 503, 504)
+# requests the event loop sends to a single host at the same time
+host_concurrency = 16
+# called with the url, the status code (None on errors) and the elapsed seconds of each request
+listeners: List[Callable[[str, Optional[int], float], None]] = []
+
+
+class Timing:
+    """Upstream requests done while measuring and the time spent waiting for them."""
+    __slots__ = ('requests', 'elapsed')
+
+    def __init__(self):
+        self.requests = 0
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return f'{self.requests} requests in {self.elapsed * 1000:.1f}ms'
+
+
+_timing: ContextVar[Optional[Timing]] = ContextVar('timing', default=None)
+# time.monotonic() by which the requests of the current context have to be done
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+_freshness: ContextVar[Optional['Freshness']] = ContextVar('freshness', default=None)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+# created on the event loop with the first request, shares its connections between all requests
+_async_session: Optional[aiohttp.ClientSession] = None
+# a semaphore per host, limiting the requests sent to it at the same time
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+class CircuitOpen(requests.ConnectionError):
+    """The host failed too often recently, so the request was not sent"""
+
+
+class BudgetExceeded(requests.Timeout):
+    """The latency budget of the current context ran out"""
+
+
+class CircuitBreaker:
+    """ Stops sending requests to a host after it failed threshold times in a row.
+    After reset_timeout seconds a single request may try again, it closes the circuit if it succeeds.
+    """
+
+    def __init__(self, host: str, threshold: int = 5, reset_timeout: float = 30, clock=time.monotonic):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened: Optional[float] = None
+        self._trying = False
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> bool:
+        return self._opened is not None
+
+    def allow(self) -> bool:
+        """Returns whether a request may be sent, only one at a time while the circuit is half open"""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._trying or self.clock() - self._opened < self.reset_timeout:
+                return False
+            self._trying = True
+            return True
+
+    def succeeded(self):
+        with self._lock:
+            if self._opened is not None:
+                logger.info(f'{self.host} is back, closing the circuit')
+            self.failures, self._opened, self._trying = 0, None, False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self._trying or (self._opened is None and self.failures >= self.threshold):
+                logger.warning(f'{self.host} failed {self.failures} times in a row, opening the circuit')
+                self._opened = self.clock()
+            self._trying = False
+
+    def released(self):
+        """The request allowed last did not tell anything about the host"""
+        with self._lock:
+            self._trying = False
+
+
+# failures in a row after which a host is not asked for reset_timeout seconds
+failure_threshold = 5
+reset_timeout = 30
+breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(url: str) -> CircuitBreaker:
+    """Returns the circuit breaker of the host of the url"""
+    host = urlparse(url).netloc
+    with _breakers_lock:
+        b = breakers.get(host)
+        if b is None:
+            b = breakers[host] = CircuitBreaker(host, failure_threshold, reset_timeout)
+        return b
+
+
+class Freshness:
+    """Whether some of the data used in a context is older than it should be, because it could not be refreshed"""
+    __slots__ = ('stale',)
+
+    def __init__(self):
+        self.stale = False
+
+
+def configure(pool_size: int = 4,
+              connect_timeout: float = 3.05,
+              read_timeout: float = 10,
+              retries: int = 2,
+              backoff: float = 0.3,
+              concurrency: int = 16):
+    """ Replaces the shared sessions.
+
+    :param pool_size: Connections kept alive per host, should match the number of worker threads
+    :param connect_timeout: Seconds to wait for a connection
+    :param read_timeout: Seconds to wait for the server to send data
+    :param retries: How often failed requests are retried
+    :param backoff: Factor of the exponential delay between retries
+    :param concurrency: Requests the event loop sends to a single host at the same time
+    """
+    global session, budget_session, timeout, max_retries, retry_backoff, host_concurrency, _async_session
+
+    retry = Retry(total=retries,
+                  backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUSES,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    new_session = requests.Session()
+    new_session.mount('http://', adapter)
+    new_session.mount('https://', adapter)
+
+    # retries could take longer than a latency budget allows
+    single = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    new_budget_session = requests.Session()
+    new_budget_session.mount('http://', single)
+    new_budget_session.mount('https://', single)
+
+    session, budget_session, timeout = new_session, new_budget_session, (connect_timeout, read_timeout)
+    max_retries, retry_backoff, host_concurrency = retries, backoff, concurrency
+    if _async_session is not None:
+        run(_async_session.close())
+        _async_session = None
+        _host_slots.clear()
+    logger.info(f'Using {pool_size} connections per host, {concurrency} on the event loop and a timeout of {timeout}')
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """ Sends a request with the shared session and records how long it took.
+    Raises CircuitOpen if the host failed too often recently and BudgetExceeded
+    if the latency budget of the current context runs out before the response arrived.
+    """
+    kwargs['timeout'] = _timeout(url, kwargs.get('timeout', timeout))
+    deadline = _deadline.get()
+    circuit = _allow(url)
+
+    status = None
+    start = time.perf_counter()
+    try:
+        response = (session if deadline is None else budget_session).request(method, url, **kwargs)
+        status = response.status_code
+        _answered(circuit, status)
+        return response
+    except requests.RequestException as e:
+        _failed(circuit, url, e)
+    finally:
+        _record(url, status, time.perf_counter() - start)
+
+
+def get(url: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+    return request('GET', url, params=params, **kwargs)
+
+
+async def request_async(method: str,
+                        url: str,
+                        params: Optional[dict] = None,
+                        headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    """ Sends a request on the event loop like request does with the shared session.
+    At most host_concurrency requests are sent to a host at the same time, waiting for that counts against the budget.
+    """
+    deadline = _deadline.get()
+    slots = _host_slots.setdefault(urlparse(url).netloc, asyncio.Semaphore(host_concurrency))
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(slots.acquire(), None if deadline is None else max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        raise BudgetExceeded(f'No time left to request {url}') from None
+
+    status = None
+    try:
+        request_timeout = _timeout(url, timeout)
+        circuit = _allow(url)
+        try:
+            response = await _send_async(method, url, params, headers, request_timeout, deadline)
+            status = response.status_code
+            _answered(circuit, status)
+            return response
+        except requests.RequestException as e:
+            _failed(circuit, url, e)
+    finally:
+        slots.release()
+        _record(url, status, time.perf_counter() - start)
+
+
+async def get_async(url: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+    return await request_async('GET', url, params=params, **kwargs)
+
+
+async def _send_async(method: str,
+                      url: str,
+                      params: Optional[dict],
+                      headers: Optional[Dict[str, str]],
+                      request_timeout: Timeout,
+                      deadline: Optional[float]) -> requests.Response:
+    """Retries like the shared session does, unless there is a latency budget"""
+    global _async_session
+    if _async_session is None:
+        # the host slots limit the connections instead
+        _async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+    # encoded like requests does it, so lists and booleans in params mean the same
+    prepared = yarl.URL(requests.Request(method, url, params=params).prepare().url, encoded=True)
+    connect, read = request_timeout
+    client_timeout = aiohttp.ClientTimeout(total=None if deadline is None else deadline - time.monotonic(),
+                                           sock_connect=connect, sock_read=read)
+
+    attempts = max_retries + 1 if deadline is None else 1
+    for attempt in range(attempts):
+        if attempt > 0:
+            await asyncio.sleep(retry_backoff * 2 ** (attempt - 1))
+        last = attempt == attempts - 1
+        try:
+            async with _async_session.request(method, prepared, headers=headers, timeout=client_timeout) as r:
+                body = await r.read()
+        except asyncio.TimeoutError as e:
+            if last:
+                raise requests.Timeout(f'{url} did not answer in time') from e
+            continue
+        except aiohttp.ClientError as e:
+            if last:
+                raise requests.ConnectionError(f'Could not request {url}: {e}') from e
+            continue
+        if r.status in RETRY_STATUSES and not last:
+            continue
+
+        # the rest of the bot only knows responses of requests
+        response = requests.Response()
+        response.status_code = r.status
+        response.reason = r.reason
+        response.url = str(r.url)
+        response.headers = CaseInsensitiveDict(r.headers)
+        response._content = body
+        return response
+
+
+def run(coroutine: Awaitable[T]) -> T:
+    """ Runs the coroutine on the shared event loop and blocks until it is done.
+    It runs in a copy of the current context, so the budget and the measurements of the caller apply.
+    """
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError('The event loop can not wait for itself, await the coroutine instead')
+    return asyncio.run_coroutine_threadsafe(coroutine, loop()).result()
+
+
+def loop() -> asyncio.AbstractEventLoop:
+    """The event loop all asynchronous requests are sent on, started with the first one"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='net-loop', daemon=True)
+            _loop_thread.start()
+            atexit.register(_close)
+        return _loop
+
+
+def _close():
+    if _async_session is not None:
+        run(_async_session.close())
+
+
+def _timeout(url: str, request_timeout) -> Timeout:
+    """Shortens the timeout to the remaining latency budget, raises BudgetExceeded if there is none left"""
+    connect, read = request_timeout if isinstance(request_timeout, tuple) else (request_timeout,) * 2
+    deadline = _deadline.get()
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise BudgetExceeded(f'No time left to request {url}')
+        if remaining < read:
+            connect, read = min(connect, remaining), remaining
+    return connect, read
+
+
+def _allow(url: str) -> CircuitBreaker:
+    circuit = breaker(url)
+    if not circuit.allow():
+        raise CircuitOpen(f'{circuit.host} failed too often, not requesting {url}')
+    return circuit
+
+
+def _answered(circuit: CircuitBreaker, status: int):
+    if status >= 500:
+        circuit.failed()
+    else:
+        circuit.succeeded()
+
+
+def _failed(circuit: CircuitBreaker, url: str, e: requests.RequestException):
+    deadline = _deadline.get()
+    if isinstance(e, requests.Timeout) and deadline is not None and time.monotonic() >= deadline - 0.01:
+        # the host may just not be as fast as the budget needs it to be
+        circuit.released()
+        raise BudgetExceeded(f'No time left to request {url}') from e
+    circuit.failed()
+    raise e
+
+
+def _record(url: str, status: Optional[int], elapsed: float):
+    timing = _timing.get()
+    if timing is not None:
+        timing.requests += 1
+        timing.elapsed += elapsed
+    for listener in listeners:
+        listener(url, status, elapsed)
+
+
+@contextmanager
+def measure():
+    """ Measures upstream requests of the current context.
+
+    Usage::
+
+        with net.measure() as timing:
+            ...
+        logger.info(f'Spent {timing} upstream')
+    """
+    timing = Timing()
+    token = _timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _timing.reset(token)
+
+
+@contextmanager
+def budget(seconds: float):
+    """ Lets all requests of the current context together take at most the given seconds,
+    nested budgets can not extend an outer one.
+    """
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def tracking_freshness():
+    """ Tells whether the data used in the current context was stale.
+
+    Usage::
+
+        with net.tracking_freshness() as freshness:
+            ...
+        if freshness.stale:
+            ...
+    """
+    freshness = Freshness()
+    token = _freshness.set(freshness)
+    try:
+        yield freshness
+    finally:
+        _freshness.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Returns the seconds left of the latency budget of the current context, None if there is no budget"""
+    deadline = _deadline.get()
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def mark_stale():
+    """Marks the data used in the current context as stale"""
+    freshness = _freshness.get()
+    if freshness is not None:
+        freshness.stale = True
+
+
+configure()
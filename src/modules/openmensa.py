@@ -1,14 +1,76 @@
+import asyncio
+import bisect
+import contextvars
+import copy
 import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import date
-from typing import Optional, List, Tuple, Union
+from typing import Awaitable, Callable, Dict, Optional, List, Set, Tuple, TypeVar, Union
 import requests
 
+from . import metrics, net
+from .cache import Entry, ResponseCache
+
 Coordinates = Tuple[float, float]
 Radius = Tuple[Coordinates, float]
+T = TypeVar('T')
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class Price:
+    __slots__ = ('students', 'employees')
+    students: Optional[float]
+    employees: Optional[float]
+
+    @classmethod
+    def from_json(cls, prices: dict) -> 'Price':
+        return cls(prices.get('Studierende'), prices.get('Bedienstete'))
+
+
+@dataclass(frozen=True)
+class Meal:
+    __slots__ = ('id', 'name', 'category', 'notes', 'prices', 'image', 'url')
+    id: int
+    name: str
+    category: Optional[str]
+    notes: Tuple[str, ...]
+    prices: Price
+    image: Optional[str]
+    url: Optional[str]
+
+    @classmethod
+    def from_json(cls, meal: dict) -> 'Meal':
+        image = meal.get('image')
+        if image is not None and image.startswith('//'):
+            # the url for the image is malformed, lets fix that
+            image = 'https:' + image
+        return cls(meal['id'], meal['name'], meal.get('category'), tuple(meal.get('notes', ())),
+                   Price.from_json(meal.get('prices') or {}), image, meal.get('url'))
+
+
+@dataclass(frozen=True)
+class Day:
+    __slots__ = ('date', 'closed')
+    date: date
+    closed: bool
+
+    @classmethod
+    def from_json(cls, day: dict) -> 'Day':
+        # the api uses 'date' in lists and 'day' for single days
+        return cls(date.fromisoformat(day['date'] if 'date' in day else day['day']), day['closed'])
+
+
 class Canteen:
+    __slots__ = ('id', 'name', 'city', 'address', 'coordinates', 'url')
+
     def __init__(self,
                  canteen_id: str,
                  name: str,
@@ -26,80 +88,120 @@ class Canteen:
         self.coordinates = coordinates
         self.url = url_canteen + f'/canteens/{self.id}'
 
+    @classmethod
+    def from_json(cls, canteen: dict) -> 'Canteen':
+        coordinates = canteen.get('coordinates')
+        if coordinates is not None:
+            coordinates = tuple(coordinates)
+        return cls(canteen['id'], canteen['name'], canteen.get('city'), canteen.get('address'), coordinates)
+
     def get_days(self,
                  day: Optional[date] = None,
-                 start: date = date.today()) -> Union[list, dict]:
+                 start: Optional[date] = None) -> Union[List[Day], Day]:
         """ List days of a canteen. Useful to determine if a canteen is open or not.
 
         :param day: Return only a single day of the date provided.
         :param start: Start day. Defaults to today
         :return:
         """
+        return net.run(self.get_days_async(day, start))
 
+    async def get_days_async(self,
+                             day: Optional[date] = None,
+                             start: Optional[date] = None) -> Union[List[Day], Day]:
         url = self.url + '/days'
         if day is None:
-            days: list = send_request(url, {'start': start.isoformat()})
-            for i in range(len(days)):
-                # NOTE use 'date' here in the list and 'day' in the dict below
-                days[i]['date'] = date.fromisoformat(days[i]['date'])
-
             # the api does return days before today, lets fix that
-            days = [day for day in days if day['date'] > date.today()]
-
-            days.sort(key=lambda k: k['date'])
-
-            return days
+            today = date.today()
+            return [d for d in await self._list_days_async(start or today) if d.date > today]
         else:
-            day: dict = send_request(url + f'/{day.isoformat()}')
+            url += f'/{day.isoformat()}'
+            return await read_through_async(
+                url,
+                lambda max_age: store.day(self.id, day, max_age),
+                lambda: send_request_async(url, parse=Day.from_json),
+                lambda fetched: store.put_day(self.id, fetched))
+
+    def get_days_between(self, start: date, end: date) -> List[Day]:
+        """ Returns the days from start to end, both included, with a single request.
+        Days the api knows nothing about are left out.
+        """
+        return net.run(self.get_days_between_async(start, end))
 
-            # I'm fixing the key inconsistency here
-            day['date'] = date.fromisoformat(day.pop('day'))
-            return day
+    async def get_days_between_async(self, start: date, end: date) -> List[Day]:
+        return [d for d in await self._list_days_async(start) if start <= d.date <= end]
+
+    async def _list_days_async(self, start: date) -> Tuple[Day, ...]:
+        url = self.url + '/days'
+        return await read_through_async(
+            url,
+            lambda max_age: store.days(self.id, start, max_age),
+            lambda: send_request_async(url, {'start': start.isoformat()}, parse=parse_days),
+            lambda fetched: store.put_days(self.id, fetched, start),
+            {'start': start.isoformat()})
+
+    def peek_day(self, day: date) -> Optional[Day]:
+        """Returns the day if it was fetched before, no matter how long ago, without sending a request"""
+        if store is not None:
+            stored = store.day(self.id, day)
+            if stored is not None:
+                return stored
+        entry = cache.get(cache_key(self.url + f'/days/{day.isoformat()}'))
+        return entry.value if entry is not None else None
 
     def get_day(self,
-                day: date) -> dict:
+                day: date) -> Day:
         """ Return a single day.
         Shortcut for get_days(canteen_id, days=[day])
         """
         return self.get_days(day=day)
 
+    async def get_day_async(self, day: date) -> Day:
+        return await self.get_days_async(day=day)
+
     def get_next_day_opened(self) -> date:
         """Returns the next day the mensa is opened."""
-        days = self.get_days()
+        return net.run(self.get_next_day_opened_async())
+
+    async def get_next_day_opened_async(self) -> date:
+        days = await self.get_days_async()
         for d in days:
-            if not d['closed']:
-                return d['date']
+            if not d.closed:
+                return d.date
 
-    def get_meals(self, day: date, id_meal: Optional[str] = None) -> Union[list, dict]:
+    def get_meals(self, day: date, id_meal: Optional[int] = None) -> Union[List[Meal], Meal]:
         """ Returns the available meals on a certain day in a canteen.
 
         :param day: the day to be searched for meals
         :param id_meal: ID of a meal to be returned
         """
+        return net.run(self.get_meals_async(day, id_meal))
 
+    async def get_meals_async(self, day: date, id_meal: Optional[int] = None) -> Union[List[Meal], Meal]:
         url = self.url + f'/days/{day.isoformat()}/meals'
 
         if id_meal is None:
-            reply = send_request(url)
-
-            # the url for the image is malformed, lets fix that
-            for meal in reply:
-                if 'image' in meal.keys():
-                    meal['image'] = 'https:' + meal['image']
+            meals = await read_through_async(
+                url,
+                lambda max_age: store.meals(self.id, day, max_age),
+                lambda: send_request_async(url, parse=parse_meals),
+                lambda fetched: store.put_meals(self.id, day, fetched))
+            meals = tuple(meals)
+            for listener in meal_listeners:
+                listener(self, day, meals)
+            return list(meals)
         else:
-            reply = send_request(url + f'/{id_meal}')
+            return await send_request_async(url + f'/{id_meal}', parse=Meal.from_json)
 
-            # same as above
-            if 'image' in reply.keys():
-                reply['image'] = 'https:' + reply['image']
-        return reply
-
-    def get_meal(self, day: date, id_meal: str) -> dict:
+    def get_meal(self, day: date, id_meal: int) -> Meal:
         """ Returns a meal
         Shortcut for get_meals(day, id_meal=id_meal)
         """
         return self.get_meals(day, id_meal=id_meal)
 
+    async def get_meal_async(self, day: date, id_meal: int) -> Meal:
+        return await self.get_meals_async(day, id_meal=id_meal)
+
     def has_coordinates(self) -> bool:
         return self.coordinates is not None
 
@@ -112,20 +214,295 @@ class Canteen:
         else:
             return False
 
+    def __hash__(self):
+        return hash(self.id)
+
+
+@dataclass(frozen=True)
+class Menu:
+    """Everything needed to answer what a canteen offers on a day"""
+    __slots__ = ('canteen', 'day', 'closed', 'meals', 'next_opened')
+    canteen: Canteen
+    day: date
+    closed: bool
+    meals: Tuple[Meal, ...]
+    next_opened: Optional[date]
+
+
+def parse_days(days: list) -> Tuple[Day, ...]:
+    return tuple(sorted(map(Day.from_json, days), key=lambda d: d.date))
+
+
+def parse_meals(meals: list) -> Tuple[Meal, ...]:
+    return tuple(map(Meal.from_json, meals))
+
+
+def parse_canteens(canteens: list) -> Tuple[Canteen, ...]:
+    return tuple(map(Canteen.from_json, canteens))
+
 
 url_canteen = ''
 
+# seconds a response stays fresh, the first pattern matching the url wins
+cache_ttl = [
+    (re.compile(r'/canteens(/[^/]+)?$'), 24 * 60 * 60),
+    (re.compile(r'/days(/[^/]+)?$'), 60 * 60),
+    (re.compile(r'/meals(/[^/]+)?$'), 10 * 60),
+]
+cache_ttl_default = 5 * 60
+cache = ResponseCache(maxsize=1024)
+# a modules.store.Store, if set the api is only asked for data missing in the store or outdated
+store = None
+_revalidate: ContextVar[bool] = ContextVar('revalidate', default=False)
+# keys of stale data that is being refreshed in the background
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+# requests sent by the event loop that have not been answered yet, by cache key
+_in_flight: Dict[str, asyncio.Future] = {}
+# the refreshes running in the background
+_background: Set[asyncio.Task] = set()
+metrics.collectors.append(lambda: [
+    ('cache_hits_total', {'cache': 'openmensa'}, cache.hits),
+    ('cache_misses_total', {'cache': 'openmensa'}, cache.misses),
+])
+
+
+def get_ttl(url: str) -> float:
+    """Returns how long a response from the url may be cached."""
+    for pattern, ttl in cache_ttl:
+        if pattern.search(url):
+            return ttl
+    return cache_ttl_default
+
+
+def cache_key(url: str, params: Optional[dict] = None) -> str:
+    """Returns the url with sorted parameters, so the order of the parameters does not matter"""
+    return requests.Request('GET', url, params=sorted((params or {}).items())).prepare().url
+
+
+def send_request(url: str, params: Optional[dict] = None, parse: Optional[Callable] = None):
+    """ Sends requests to the url with parameters and returns the response.
+    Responses are cached, stale ones are revalidated with a conditional request.
+
+    :param parse: Converts the json once before it is cached, the result should be immutable
+    """
+    return net.run(send_request_async(url, params, parse))
 
-def send_request(url: str, params: Optional[dict] = None):
-    """ Sends requests to the url with parameters and returns the response."""
 
+async def send_request_async(url: str, params: Optional[dict] = None, parse: Optional[Callable] = None):
     if not url.isprintable():
         raise ValueError('Url must not be null or empty')
 
+    key = cache_key(url, params)
+    entry = cache.get(key)
+    if entry is not None and cache.is_fresh(entry) and not _revalidate.get():
+        cache.hits += 1
+        return _cached_value(entry, parse)
+    cache.misses += 1
+
+    # concurrent misses of the same url share a single request
+    request = _in_flight.get(key)
+    if request is None:
+        # a new context, so the request is not limited by the budget of whoever happened to start it
+        request = _in_flight[key] = contextvars.Context().run(
+            asyncio.ensure_future, _request(key, url, params, parse, entry))
+        request.add_done_callback(lambda _: _in_flight.pop(key, None))
+    try:
+        # every caller only waits as long as its own budget allows, the request goes on for the others
+        data, stale = await asyncio.wait_for(asyncio.shield(request), net.remaining())
+    except asyncio.TimeoutError:
+        if entry is None:
+            raise net.BudgetExceeded(f'No time left to wait for {url}') from None
+        logger.warning(f'Using the stale response of {url}, the request did not finish within the budget')
+        net.mark_stale()
+        return _cached_value(entry, parse)
+    if stale:
+        net.mark_stale()
+    # raw json may be changed by the caller, so it is copied
+    return data if parse is not None else copy.deepcopy(data)
+
+
+async def _request(key: str, url: str, params: Optional[dict], parse: Optional[Callable], entry: Optional[Entry]):
+    """Returns the data and whether it is stale"""
+    headers = entry.validators() if entry is not None else {}
     logger.debug(f'Sending request to {url}')
-    response = requests.get(url, params)
+    try:
+        response = await net.get_async(url, params, headers=headers)
+    except requests.RequestException as e:
+        if entry is None:
+            raise
+        # answer with what is known and fetch it again without hurrying anyone
+        logger.warning(f'Using the stale response of {url}: {e}')
+        # not joining this request, which is about to fail
+        refresh_later(key, lambda: _request(key, url, params, parse, cache.get(key)))
+        return entry.value, True
+
+    ttl = get_ttl(url)
+    if entry is not None and response.status_code == 304:
+        logger.debug(f'{url} has not been modified')
+        cache.touch(key, ttl)
+        return entry.value, False
+
+    if parse is not None:
+        # error messages of the api can not be parsed
+        response.raise_for_status()
+
     response.encoding = 'UTF-8'
-    return response.json()
+    data = response.json()
+    if parse is not None:
+        data = parse(data)
+    if response.ok:
+        cache.put(key, data, ttl, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return data, False
+
+
+async def read_through_async(url: str,
+                             load: Callable[[float], Optional[T]],
+                             fetch: Callable[[], Awaitable[T]],
+                             save: Callable[[T], None],
+                             params: Optional[dict] = None) -> T:
+    """ Returns the data from memory if it is cached, else from the store if it was fetched recently,
+    else fetches it and saves it to the store.
+
+    :param url: The url the data is fetched from, determines how long the stored data is fresh
+    :param load: Loads data from the store that is not older than the given seconds or returns None
+    :param fetch: Fetches the parsed response of url with params from the api
+    :param save: Saves fetched data to the store
+    :param params: The parameters fetch sends, together with url they are the key of the cached response
+    """
+    # while revalidating, data has to be fetched to be refreshed
+    if not _revalidate.get():
+        key = cache_key(url, params)
+        entry = cache.get(key)
+        if entry is not None and cache.is_fresh(entry):
+            cache.hits += 1
+            return entry.value
+        # after a restart, the store knows what the cache does not
+        if store is not None:
+            stored = await _blocking(load, get_ttl(url))
+            if stored is not None:
+                cache.misses += 1
+                stored = tuple(stored) if isinstance(stored, list) else stored
+                # its age is not known, so it is kept for a whole ttl
+                cache.put(key, stored, get_ttl(url))
+                return stored
+
+    async def refresh():
+        fetched, stale = await _fetch_tracked(fetch)
+        if not stale:
+            await _blocking(save, fetched)
+
+    # the refreshes of the cache do not write to the store
+    refresh_key = f'store {url}'
+    try:
+        fetched, stale = await _fetch_tracked(fetch)
+    except requests.RequestException as e:
+        stored = await _blocking(load, float('inf')) if store is not None else None
+        if stored is None:
+            raise
+        logger.warning(f'Using stale data of {url} from the store: {e}')
+        net.mark_stale()
+        refresh_later(refresh_key, refresh)
+        return stored
+    if stale:
+        # saving the old data would make it look fresh in the store
+        net.mark_stale()
+        if store is not None:
+            refresh_later(refresh_key, refresh)
+        return fetched
+    if store is not None:
+        try:
+            await _blocking(save, fetched)
+        except sqlite3.Error as e:
+            logger.warning(f'Could not save {url}: {e}')
+    return fetched
+
+
+def _blocking(function: Callable[..., T], *args) -> Awaitable[T]:
+    """Runs function on a thread of the default executor, so sqlite does not block the event loop"""
+    return asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def _fetch_tracked(fetch: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+    """Returns the fetched data and whether it is stale"""
+    with net.tracking_freshness() as freshness:
+        fetched = await fetch()
+    return fetched, freshness.stale
+
+
+def refresh_later(key: str, refresh: Callable[[], Awaitable]):
+    """ Runs refresh on the event loop without a latency budget, unless a refresh of the key is running already.
+    Failures are only logged, the next request tries again.
+    """
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    async def run():
+        try:
+            with revalidating():
+                await refresh()
+        except Exception as e:
+            logger.info(f'Could not refresh {key}: {e}')
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    # a new context, so neither the budget nor the measurements of the caller apply
+    task = contextvars.Context().run(net.loop().create_task, run())
+    # the loop only keeps weak references to its tasks
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _cached_value(entry: Entry, parse: Optional[Callable]):
+    # raw json may be changed by the caller, so it is copied
+    return entry.value if parse is not None else copy.deepcopy(entry.value)
+
+
+@contextmanager
+def revalidating():
+    """ Treats all cached responses as stale within this context, so they are revalidated
+    and stay fresh for another ttl. Unchanged responses only cost a 304.
+    """
+    token = _revalidate.set(True)
+    try:
+        yield
+    finally:
+        _revalidate.reset(token)
+
+
+def get_menu(canteen: Canteen, day: date) -> Menu:
+    """ Returns the meals of a canteen on a day. The meals, the day and the next day the
+    canteen is opened are requested concurrently, so this takes about one round trip.
+    """
+    return net.run(get_menu_async(canteen, day))
+
+
+async def get_menu_async(canteen: Canteen, day: date) -> Menu:
+    meals, current, next_opened = await asyncio.gather(
+        canteen.get_meals_async(day), canteen.get_day_async(day), canteen.get_next_day_opened_async())
+    return Menu(canteen, day, current.closed, tuple(meals), next_opened)
+
+
+def get_menus(canteen: Canteen, start: date, end: date) -> List[Menu]:
+    """ Returns the menus of a canteen from start to end. The days are requested once,
+    then the meals of all open days concurrently, so this takes about two round trips.
+    """
+    return net.run(get_menus_async(canteen, start, end))
+
+
+async def get_menus_async(canteen: Canteen, start: date, end: date) -> List[Menu]:
+    days = await canteen.get_days_between_async(start, end)
+    opened = [d.date for d in days if not d.closed]
+    meals = dict(zip(opened, await asyncio.gather(*(canteen.get_meals_async(d) for d in opened))))
+
+    menus = []
+    for i, d in enumerate(days):
+        next_opened = next((later.date for later in days[i + 1:] if not later.closed), None)
+        menus.append(Menu(canteen, d.date, d.closed, tuple(meals.get(d.date, ())), next_opened))
+    return menus
 
 
 def get_canteens(near: Optional[Radius] = None,
@@ -139,7 +516,12 @@ def get_canteens(near: Optional[Radius] = None,
 
     :return: A dict with all canteens
     """
+    return net.run(get_canteens_async(near, ids, has_coordinates))
+
 
+async def get_canteens_async(near: Optional[Radius] = None,
+                             ids: Optional[List[str]] = None,
+                             has_coordinates: bool = False) -> List[Canteen]:
     params = {}
     # add arguments to the params
     if near is not None:
@@ -168,19 +550,346 @@ def get_canteens(near: Optional[Radius] = None,
         params['hasCoordinates'] = has_coordinates
 
     # send request and return answer
-    response: list = send_request(url_canteen + '/canteens', params)
-    canteens = []
+    url = url_canteen + '/canteens'
+    if near is not None or ids is not None or has_coordinates:
+        return list(await send_request_async(url, params, parse=parse_canteens))
 
-    for c in response:
-        response.pop(response.index(c))
-        canteens.append(Canteen(c['id'], c['name'], c['city'], c['address'], c['coordinates']))
-
-    return canteens
+    # only the list of all canteens is kept in the store
+    return list(await read_through_async(
+        url,
+        lambda max_age: store.canteens(max_age),
+        lambda: send_request_async(url, params, parse=parse_canteens),
+        lambda fetched: store.put_canteens(fetched),
+        params))
 
 
 def get_canteen(id_canteen: str) -> Canteen:
     """ Returns a canteen
     """
+    return net.run(get_canteen_async(id_canteen))
+
+
+async def get_canteen_async(id_canteen: str) -> Canteen:
+    return await send_request_async(url_canteen + f'/canteens/{id_canteen}', parse=Canteen.from_json)
 
-    c = send_request(url_canteen + f'/canteens/{id_canteen}')
-    return Canteen(c['id'], c['name'], c['city'], c['address'], c['coordinates'])
+
+def slugify(name: str) -> str:
+    """Returns the name used to look up a canteen, f.e. alte-mensa"""
+    return name.casefold().replace(' ', '-')
+
+
+def trigrams(word: str) -> Set[str]:
+    word = f'  {word} '
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class CanteenIndex:
+    """ Looks up canteens by their slugified name without sending any requests.
+    A query matches exactly, as a prefix, as a substring or, to tolerate typos,
+    by the similarity of its trigrams. Earlier kinds of matches take precedence.
+    """
+
+    # minimal dice coefficient of the trigrams for a fuzzy match
+    similarity = 0.4
+
+    def __init__(self, canteens: Optional[List[Canteen]] = None):
+        self.update(canteens or [])
+
+    def update(self, canteens: List[Canteen]):
+        """Replaces the indexed canteens"""
+        by_slug: Dict[str, Canteen] = {}
+        for c in canteens:
+            by_slug.setdefault(slugify(c.name), c)
+        slugs = sorted(by_slug)
+
+        grams: Dict[str, Set[str]] = {}
+        for slug in slugs:
+            for gram in trigrams(slug):
+                grams.setdefault(gram, set()).add(slug)
+
+        # swap at once, so lookups never see a half built index
+        self._index = by_slug, slugs, grams
+
+    @property
+    def listing(self) -> str:
+        """The names of all canteens, one per line"""
+        return '\n'.join(self._index[1])
+
+    def find(self, query: str) -> Optional[Canteen]:
+        """Returns the canteen matching the query best or None"""
+        query = slugify(query.strip())
+        by_slug, slugs, grams = self._index
+        if query == '' or not slugs:
+            return None
+
+        if query in by_slug:
+            return by_slug[query]
+
+        i = bisect.bisect_left(slugs, query)
+        if i < len(slugs) and slugs[i].startswith(query):
+            return by_slug[slugs[i]]
+
+        for slug in slugs:
+            if query in slug:
+                return by_slug[slug]
+
+        query_grams = trigrams(query)
+        shared: Dict[str, int] = {}
+        for gram in query_grams:
+            for slug in grams.get(gram, ()):
+                shared[slug] = shared.get(slug, 0) + 1
+        best, best_score = None, self.similarity
+        for slug, count in sorted(shared.items()):
+            score = 2 * count / (len(query_grams) + len(trigrams(slug)))
+            if score > best_score:
+                best, best_score = slug, score
+        return by_slug[best] if best is not None else None
+
+    def __len__(self):
+        return len(self._index[1])
+
+
+canteen_index = CanteenIndex()
+
+
+def tokenize(text: str) -> Set[str]:
+    """Returns the words of a text that are searched for"""
+    return {w for w in re.findall(r'\w+', text.casefold()) if len(w) > 1}
+
+
+MealKey = Tuple[str, date]
+Found = Tuple[Canteen, date, Meal]
+
+
+class MealIndex:
+    """ Finds meals of all canteens by words of their names, notes and categories without sending any requests.
+    Every word of a query has to be part of a word of the meal, so nudel finds Bandnudeln.
+    The meals of a canteen on a day are replaced whenever they were fetched and changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meals: Dict[MealKey, Tuple[Canteen, Tuple[Meal, ...]]] = {}
+        # word -> canteen and day -> positions of the meals containing the word
+        self._postings: Dict[str, Dict[MealKey, Set[int]]] = {}
+        self._words: Dict[MealKey, Set[str]] = {}
+
+    def update(self, canteen: Canteen, day: date, meals: Tuple[Meal, ...]):
+        """Replaces the meals of a canteen on a day"""
+        key = (canteen.id, day)
+        with self._lock:
+            indexed = self._meals.get(key)
+            if indexed is not None and (indexed[1] is meals or indexed[1] == meals):
+                return
+            self._remove(key)
+
+            words: Set[str] = set()
+            for i, meal in enumerate(meals):
+                for word in tokenize(' '.join((meal.name, meal.category or '') + meal.notes)):
+                    self._postings.setdefault(word, {}).setdefault(key, set()).add(i)
+                    words.add(word)
+            self._meals[key] = (canteen, meals)
+            self._words[key] = words
+
+    def _remove(self, key: MealKey):
+        for word in self._words.pop(key, ()):
+            postings = self._postings[word]
+            del postings[key]
+            if not postings:
+                del self._postings[word]
+        self._meals.pop(key, None)
+
+    def prune(self, before: date):
+        """Removes the meals of days before the given one"""
+        with self._lock:
+            for key in [k for k in self._meals if k[1] < before]:
+                self._remove(key)
+
+    def search(self, query: str, start: Optional[date] = None, end: Optional[date] = None) -> List[Found]:
+        """Returns the meals matching every word of the query from start to end, sorted by day and canteen"""
+        words = tokenize(query)
+        if not words:
+            return []
+
+        with self._lock:
+            matches: Optional[Set[Tuple[MealKey, int]]] = None
+            for word in words:
+                found = {(key, i)
+                         for indexed, postings in self._postings.items() if word in indexed
+                         for key, positions in postings.items()
+                         if (start is None or key[1] >= start) and (end is None or key[1] <= end)
+                         for i in positions}
+                matches = found if matches is None else matches & found
+                if not matches:
+                    return []
+            results = [(self._meals[key][0], key[1], self._meals[key][1][i]) for key, i in matches]
+        return sorted(results, key=lambda r: (r[1], r[0].name, r[2].name))
+
+    def __len__(self):
+        return len(self._meals)
+
+
+meal_index = MealIndex()
+# called with the canteen, the day and the meals whenever meals were read, the search is kept up to date this way
+meal_listeners: List[Callable[[Canteen, date, Tuple[Meal, ...]], None]] = [meal_index.update]
+
+
+def index_meals(days: List[date]) -> int:
+    """ Loads the meals of all canteens on the open days into the meal index.
+    Meals are read from the store and the cache where possible, the rest is fetched concurrently.
+
+    :return: the number of canteens and menus that could not be loaded
+    """
+    return net.run(index_meals_async(days))
+
+
+async def index_meals_async(days: List[date]) -> int:
+    start = time.perf_counter()
+    canteens = await get_canteens_async()
+    listed = await asyncio.gather(*(c.get_days_between_async(min(days), max(days)) for c in canteens),
+                                  return_exceptions=True)
+
+    failed = 0
+    fetching: List[Tuple[Canteen, date]] = []
+    for c, c_days in zip(canteens, listed):
+        if isinstance(c_days, Exception):
+            failed += 1
+            logger.warning(f'Could not index the days of {c.name}: {c_days}')
+            continue
+        fetching.extend((c, d.date) for d in c_days if not d.closed and d.date in days)
+    fetched = await asyncio.gather(*(c.get_meals_async(d) for c, d in fetching), return_exceptions=True)
+    for (c, d), meals in zip(fetching, fetched):
+        if isinstance(meals, Exception):
+            failed += 1
+            logger.warning(f'Could not index the meals of {c.name} on {d.isoformat()}: {meals}')
+
+    logger.info(f'Indexed the meals of {len(fetching)} days of {len(canteens)} canteens '
+                f'in {time.perf_counter() - start:.2f}s, {failed} failed')
+    return failed
+
+
+EARTH_RADIUS = 6371.0
+Nearby = Tuple[Canteen, float]
+
+
+def distance(a: Coordinates, b: Coordinates) -> float:
+    """Returns the distance between two points on earth in km"""
+    lat_a, lng_a, lat_b, lng_b = map(math.radians, (*a, *b))
+    h = math.sin((lat_b - lat_a) / 2) ** 2 + math.cos(lat_a) * math.cos(lat_b) * math.sin((lng_b - lng_a) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+class NearbyIndex:
+    """ Finds the canteens closest to a point without sending any requests.
+    Canteens are put into a grid of cells a few hundred meters wide, a lookup
+    only looks at the rings of cells around the point until the closest canteens are certain.
+    """
+
+    # width and height of a cell in degrees
+    cell_size = 0.01
+
+    def __init__(self, canteens: Optional[List[Canteen]] = None):
+        self.update(canteens or [])
+
+    def _cell(self, coordinates: Coordinates) -> Tuple[int, int]:
+        return math.floor(coordinates[0] / self.cell_size), math.floor(coordinates[1] / self.cell_size)
+
+    def update(self, canteens: List[Canteen]):
+        """Replaces the indexed canteens, those without coordinates are left out"""
+        cells: Dict[Tuple[int, int], List[Canteen]] = {}
+        for c in canteens:
+            if c.has_coordinates():
+                cells.setdefault(self._cell(c.coordinates), []).append(c)
+        # swap at once, so lookups never see a half built index
+        self._cells = cells
+
+    def nearest(self, coordinates: Coordinates, k: int = 5, max_distance: float = 10) -> List[Nearby]:
+        """Returns up to k canteens within max_distance km of the coordinates and their distance, closest first"""
+        cells = self._cells
+        if not cells:
+            return []
+
+        lat, lng = self._cell(coordinates)
+        # every canteen outside of ring r is at least this far away per ring
+        ring_width = self.cell_size * min(111.0, 111.0 * math.cos(math.radians(min(abs(coordinates[0]), 89.0))))
+        max_ring = min(int(max_distance / ring_width) + 1,
+                       max(max(abs(c[0] - lat), abs(c[1] - lng)) for c in cells))
+        found: List[Nearby] = []
+        for r in range(max_ring + 1):
+            for i in range(lat - r, lat + r + 1):
+                for j in range(lng - r, lng + r + 1):
+                    if max(abs(i - lat), abs(j - lng)) != r:
+                        continue
+                    for c in cells.get((i, j), ()):
+                        d = distance(coordinates, c.coordinates)
+                        if d <= max_distance:
+                            found.append((c, d))
+            found.sort(key=lambda n: n[1])
+            if len(found) >= k and found[k - 1][1] <= r * ring_width:
+                break
+        return found[:k]
+
+    def __len__(self):
+        return sum(map(len, self._cells.values()))
+
+
+nearby_index = NearbyIndex()
+
+
+def index_canteens(canteens: List[Canteen]):
+    """Replaces the canteens found by name and by location"""
+    canteen_index.update(canteens)
+    nearby_index.update(canteens)
+
+
+def refresh_canteen_index():
+    """Fetches all canteens and rebuilds the indexes"""
+    canteens = get_canteens()
+    index_canteens(canteens)
+    logger.info(f'Indexed {len(canteen_index)} canteens, {len(nearby_index)} of them by location')
+
+
+def find_nearby(coordinates: Coordinates, k: int = 5, max_distance: float = 10) -> List[Nearby]:
+    """ Returns the canteens closest to the coordinates. Only fetches the canteens if the index
+    has not been built yet, it should be refreshed in the background instead.
+    """
+    if len(canteen_index) == 0:
+        refresh_canteen_index()
+    return nearby_index.nearest(coordinates, k, max_distance)
+
+
+def find_canteen(name: str) -> Optional[Canteen]:
+    """ Returns the canteen matching name. Only fetches the canteens if the index
+    has not been built yet, it should be refreshed in the background instead.
+    """
+    if len(canteen_index) == 0:
+        refresh_canteen_index()
+    return canteen_index.find(name)
+
+
+def prefetch(days: List[date]) -> int:
+    """ Loads the canteens and the menus of all canteens on days into the cache.
+    All menus are requested at once, the event loop limits how many requests the api gets at the same time.
+
+    :return: the number of menus that could not be loaded
+    """
+    return net.run(prefetch_async(days))
+
+
+async def prefetch_async(days: List[date]) -> int:
+    start = time.perf_counter()
+    with revalidating():
+        canteens = await get_canteens_async()
+        index_canteens(canteens)
+
+        menus = [(c, d) for c in canteens for d in days]
+        fetched = await asyncio.gather(*(get_menu_async(c, d) for c, d in menus), return_exceptions=True)
+    failed = 0
+    for (c, d), menu in zip(menus, fetched):
+        if isinstance(menu, Exception):
+            failed += 1
+            logger.warning(f'Could not prefetch the menu of {c.name} on {d.isoformat()}: {menu}')
+
+    logger.info(f'Prefetched {len(menus) - failed} menus of {len(canteens)} canteens '
+                f'in {time.perf_counter() - start:.2f}s, {failed} failed')
+    return failed
@@ -0,0 +1,150 @@
+import importlib
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram.ext import BaseFilter, CallbackQueryHandler, CommandHandler, Dispatcher, InlineQueryHandler, \
+    JobQueue, MessageHandler
+
+from . import metrics, net
+
+logger = logging.getLogger(__name__)
+
+# seconds it took to import the module of each plugin
+import_times: Dict[str, float] = {}
+
+
+class Plugin:
+    """ A feature of the bot. Its handlers and jobs are given by their names in module,
+    which is only imported once the first update or job needs it.
+    """
+
+    def __init__(self,
+                 name: str,
+                 module: str,
+                 package: Optional[str] = None,
+                 commands: Optional[Dict[str, str]] = None,
+                 callback: Optional[str] = None,
+                 inline: Optional[str] = None,
+                 messages: Optional[List[Tuple[BaseFilter, str]]] = None,
+                 jobs: Optional[List[Tuple[str, str, dict]]] = None,
+                 setup: Optional[str] = None,
+                 budgets: Optional[Dict[str, float]] = None,
+                 help: str = ''):
+        """
+        :param name: Unique name, also the namespace of the callback data of its buttons
+        :param module: The module implementing the plugin, relative to package if it starts with a dot
+        :param commands: Maps commands to the name of their handler
+        :param callback: Handles button presses with callback data in the namespace of the plugin
+        :param inline: Handles inline queries
+        :param messages: Handlers for messages matching a filter
+        :param jobs: Name of the callback, name of the method of the job queue and its arguments
+        :param setup: Called once right after the module was imported
+        :param budgets: Maps handlers to the seconds their upstream requests may take together
+        :param help: Lines describing the commands of the plugin
+        """
+        if ':' in name:
+            raise ValueError('name must not contain a colon')
+
+        self.name = name
+        self.module = module
+        self.package = package
+        self.commands = commands or {}
+        self.callback = callback
+        self.inline = inline
+        self.messages = messages or []
+        self.jobs = jobs or []
+        self.setup = setup
+        self.budgets = budgets or {}
+        self.help = help
+        self._loaded: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded is not None
+
+    def load(self) -> ModuleType:
+        """Imports the module of the plugin, if that did not happen yet"""
+        if self._loaded is not None:
+            return self._loaded
+        with self._lock:
+            if self._loaded is None:
+                start = time.perf_counter()
+                module = importlib.import_module(self.module, self.package)
+                if self.setup is not None:
+                    getattr(module, self.setup)()
+                import_times[self.name] = time.perf_counter() - start
+                logger.info(f'Loaded plugin {self.name} in {import_times[self.name] * 1000:.1f}ms')
+                self._loaded = module
+        return self._loaded
+
+    def lazy(self, attribute: str, metric: str = 'handler_seconds') -> Callable:
+        """ Returns a callback that loads the plugin on its first call and logs the time spent upstream
+        :param metric: Histogram the duration of each call is observed in, labeled with the attribute
+        """
+        budget = self.budgets.get(attribute)
+
+        def callback(*args, **kwargs):
+            handler = getattr(self.load(), attribute)
+            with metrics.timer(metric, handler=attribute), metrics.profiled(attribute), net.measure() as timing, \
+                    net.budget(budget) if budget is not None else nullcontext():
+                result = handler(*args, **kwargs)
+            if timing.requests:
+                logger.info(f'{self.name}.{attribute} spent {timing} upstream.')
+            return result
+        callback.__name__ = f'{self.name}.{attribute}'
+        return callback
+
+
+registry: Dict[str, Plugin] = {}
+
+
+def register(plugin: Plugin):
+    if plugin.name in registry:
+        raise ValueError(f'A plugin named {plugin.name} is already registered')
+    registry[plugin.name] = plugin
+
+
+def callback_data(plugin: str, data: str) -> str:
+    """Returns the callback data of a button handled by a plugin"""
+    return f'{plugin}:{data}'
+
+
+def route_callback(update, context):
+    """Passes a button press to the plugin named in its callback data"""
+    query = update.callback_query
+    name, _, data = (query.data or '').partition(':')
+    plugin = registry.get(name)
+    if plugin is None or plugin.callback is None:
+        logger.warning(f'No plugin handles the button {query.data}')
+        query.answer()
+        query.edit_message_text(text='Unknown button')
+        return
+    return plugin.lazy(plugin.callback)(update, context, data)
+
+
+def add_handlers(dispatcher: Dispatcher):
+    """Registers the commands, buttons and inline queries of all plugins"""
+    for plugin in registry.values():
+        for command, handler in plugin.commands.items():
+            dispatcher.add_handler(CommandHandler(command, plugin.lazy(handler)))
+        for message_filter, handler in plugin.messages:
+            dispatcher.add_handler(MessageHandler(message_filter, plugin.lazy(handler)))
+        if plugin.inline is not None:
+            dispatcher.add_handler(InlineQueryHandler(plugin.lazy(plugin.inline)))
+    dispatcher.add_handler(CallbackQueryHandler(route_callback))
+
+
+def add_jobs(job_queue: JobQueue):
+    """Schedules the jobs of all plugins"""
+    for plugin in registry.values():
+        for callback, method, kwargs in plugin.jobs:
+            getattr(job_queue, method)(plugin.lazy(callback, 'job_seconds'), **kwargs)
+
+
+def help_text() -> str:
+    return '\n'.join(p.help for p in registry.values() if p.help)
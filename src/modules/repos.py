@@ -0,0 +1,329 @@
+import logging
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import requests
+
+from . import metrics, net
+from .cache import Entry
+
+logger = logging.getLogger(__name__)
+
+url_github_api = 'https://api.github.com'
+# raises the rate limit of github from 60 to 5000 requests per hour
+github_token: Optional[str] = None
+# commits listed per update of a branch
+max_commits = 5
+
+# owner/name or the url of a repository on github
+GITHUB_REPO = re.compile(r'^(?:https?://github\.com/)?([\w.-]+)/([\w.-]+?)(?:\.git)?/?$')
+# the branch github answers with if none was asked for
+DEFAULT_BRANCH = 'HEAD'
+
+
+@dataclass(frozen=True)
+class Commit:
+    __slots__ = ('sha', 'message', 'author', 'url')
+    sha: str
+    # first line of the message
+    message: str
+    author: str
+    url: Optional[str]
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """The heads of the branches of a repository and, if the repository tells them, its latest commits"""
+    __slots__ = ('heads', 'commits')
+    heads: Dict[str, str]
+    # newest first
+    commits: Tuple[Commit, ...]
+
+    def commits_since(self, sha: Optional[str]) -> Tuple[Commit, ...]:
+        new = []
+        for commit in self.commits:
+            if commit.sha == sha or len(new) == max_commits:
+                break
+            new.append(commit)
+        return tuple(new)
+
+
+@dataclass(frozen=True)
+class Update:
+    """A branch that moved, was created or was deleted"""
+    __slots__ = ('repo', 'branch', 'before', 'after', 'commits')
+    repo: 'Repo'
+    branch: str
+    # None for a new branch
+    before: Optional[str]
+    # None for a deleted branch
+    after: Optional[str]
+    commits: Tuple[Commit, ...]
+
+
+class Repo(ABC):
+    """A repository that is polled at url"""
+
+    def __init__(self, name: str, url: str, spec: str):
+        """:param spec: What parse_repo makes this repository from"""
+        self.name = name
+        self.url = url
+        self.spec = spec
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {}
+
+    @abstractmethod
+    def parse(self, response: requests.Response) -> Snapshot:
+        pass
+
+    def __eq__(self, other):
+        return isinstance(other, Repo) and self.url == other.url
+
+    def __hash__(self):
+        return hash(self.url)
+
+    def __repr__(self):
+        return self.name
+
+
+class GitRepo(Repo):
+    """ A repository served over http by any web server, for example a bare repository after
+    git update-server-info. Only info/refs is requested, so the commits are not known.
+    """
+
+    def __init__(self, url: str):
+        url = url.rstrip('/')
+        name = url.rsplit('/', 1)[-1]
+        super().__init__(name[:-4] if name.endswith('.git') else name, url + '/info/refs', url)
+
+    def parse(self, response: requests.Response) -> Snapshot:
+        heads = {}
+        for line in response.text.splitlines():
+            sha, _, ref = line.partition('\t')
+            if ref.startswith('refs/heads/'):
+                heads[ref[len('refs/heads/'):]] = sha
+        return Snapshot(heads, ())
+
+
+class GitHubRepo(Repo):
+    """A repository on github, the latest commits of its default branch are requested"""
+
+    def __init__(self, owner: str, name: str):
+        super().__init__(f'{owner}/{name}', f'{url_github_api}/repos/{owner}/{name}/commits?per_page={max_commits}',
+                         f'{owner}/{name}')
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {'Accept': 'application/vnd.github.v3+json'}
+        if github_token:
+            headers['Authorization'] = f'token {github_token}'
+        return headers
+
+    def parse(self, response: requests.Response) -> Snapshot:
+        commits = tuple(Commit(
+            c['sha'],
+            c['commit']['message'].split('\n', 1)[0],
+            c['commit']['author']['name'],
+            c.get('html_url')) for c in response.json())
+        return Snapshot({DEFAULT_BRANCH: commits[0].sha} if commits else {}, commits)
+
+
+def parse_repo(spec: str) -> Repo:
+    """:param spec: owner/name of a repository on github or the url of any other repository"""
+    match = GITHUB_REPO.match(spec)
+    if match:
+        return GitHubRepo(*match.groups())
+    if spec.startswith(('http://', 'https://')):
+        return GitRepo(spec)
+    raise ValueError(f'{spec} is not a repository')
+
+
+def diff(repo: Repo, old: Snapshot, new: Snapshot) -> List[Update]:
+    updates = []
+    for branch, after in new.heads.items():
+        before = old.heads.get(branch)
+        if before != after:
+            updates.append(Update(repo, branch, before, after, new.commits_since(before)))
+    for branch in old.heads.keys() - new.heads.keys():
+        updates.append(Update(repo, branch, old.heads[branch], None, ()))
+    return updates
+
+
+class FollowStore:
+    """Keeps which chats follow which repositories on disk, so they survive a restart"""
+
+    def __init__(self, path: str):
+        """:param path: The sqlite database, created if it does not exist"""
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS follows ('
+                                     'chat_id INTEGER NOT NULL, repo TEXT NOT NULL, PRIMARY KEY (chat_id, repo))')
+        logger.info(f'Opened store {path}')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def follow(self, chat_id: int, repo: str):
+        """:param repo: What the repository was parsed from"""
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO follows VALUES (?, ?)', (chat_id, repo))
+
+    def unfollow(self, chat_id: int, repo: Optional[str] = None):
+        """Removes the repository followed by the chat or, without a repository, all of them"""
+        with self._lock, self._connection:
+            if repo is None:
+                self._connection.execute('DELETE FROM follows WHERE chat_id = ?', (chat_id,))
+            else:
+                self._connection.execute('DELETE FROM follows WHERE chat_id = ? AND repo = ?', (chat_id, repo))
+
+    def migrate_chat(self, old_chat_id: int, new_chat_id: int):
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE OR REPLACE follows SET chat_id = ? WHERE chat_id = ?',
+                                     (new_chat_id, old_chat_id))
+
+    def follows(self) -> List[Tuple[int, str]]:
+        """Returns chat and repository of everything followed"""
+        with self._lock:
+            return self._connection.execute('SELECT chat_id, repo FROM follows ORDER BY rowid').fetchall()
+
+
+class RepoWatcher:
+    """ Polls the repositories followed by chats for new commits.
+    Each repository is polled once per interval, no matter how many chats follow it,
+    and the polls are spread evenly across the interval instead of all starting at once.
+    Polls are conditional requests, so an unchanged repository costs a 304 without a body.
+    The first poll of a repository is what later ones are compared to.
+    """
+
+    def __init__(self, interval: float = 10 * 60, store: Optional[FollowStore] = None):
+        """
+        :param interval: Seconds between two polls of the same repository
+        :param store: Keeps who follows which repository across restarts
+        """
+        self.interval = interval
+        self.store = store
+        self._lock = threading.Lock()
+        self._followers: Dict[Repo, Set[int]] = {}
+        # the last response of every repository, to revalidate it
+        self._entries: Dict[Repo, Entry] = {}
+        # the repositories in the order they are polled in
+        self._order: List[Repo] = []
+        self._next = 0
+        # repositories that are due but have not been polled yet
+        self._due = 0.0
+        if store is not None:
+            # what the repositories looked like before the restart is not known, so their next poll only remembers it
+            for chat_id, spec in store.follows():
+                self._follow(chat_id, parse_repo(spec))
+
+    def follow(self, chat_id: int, repo: Repo):
+        if self.store is not None:
+            self.store.follow(chat_id, repo.spec)
+        self._follow(chat_id, repo)
+
+    def _follow(self, chat_id: int, repo: Repo):
+        with self._lock:
+            if repo not in self._followers:
+                self._followers[repo] = set()
+                self._order.append(repo)
+            self._followers[repo].add(chat_id)
+
+    def unfollow(self, chat_id: int, repo: Optional[Repo] = None):
+        """Stops telling the chat about the repository, or about all repositories if none is given"""
+        if self.store is not None:
+            self.store.unfollow(chat_id, repo.spec if repo else None)
+        with self._lock:
+            for followed in [repo] if repo else list(self._followers):
+                chat_ids = self._followers.get(followed)
+                if chat_ids is None:
+                    continue
+                chat_ids.discard(chat_id)
+                if not chat_ids:
+                    del self._followers[followed]
+                    self._order.remove(followed)
+                    self._entries.pop(followed, None)
+
+    def migrate(self, old_chat_id: int, new_chat_id: int):
+        if self.store is not None:
+            self.store.migrate_chat(old_chat_id, new_chat_id)
+        with self._lock:
+            for chat_ids in self._followers.values():
+                if old_chat_id in chat_ids:
+                    chat_ids.discard(old_chat_id)
+                    chat_ids.add(new_chat_id)
+
+    def following(self, chat_id: int) -> List[Repo]:
+        with self._lock:
+            return [repo for repo in self._order if chat_id in self._followers[repo]]
+
+    def poll(self, repo: Repo) -> List[Update]:
+        """ Asks the repository whether it changed since the last poll.
+        Raises a RequestException if it could not be asked.
+        """
+        with self._lock:
+            entry = self._entries.get(repo)
+        headers = repo.headers
+        if entry is not None:
+            headers.update(entry.validators())
+        try:
+            response = net.get(repo.url, headers=headers)
+            if response.status_code == 304:
+                metrics.inc('repo_polls_total', result='unchanged')
+                return []
+            response.raise_for_status()
+        except requests.RequestException:
+            metrics.inc('repo_polls_total', result='error')
+            raise
+        snapshot = repo.parse(response)
+        with self._lock:
+            self._entries[repo] = Entry(snapshot, 0, response.headers.get('ETag'),
+                                        response.headers.get('Last-Modified'))
+        metrics.inc('repo_polls_total', result='changed')
+        return diff(repo, entry.value, snapshot) if entry is not None else []
+
+    def due(self, elapsed: float) -> List[Repo]:
+        """Returns the repositories to poll now, if this is called every elapsed seconds"""
+        with self._lock:
+            if not self._order:
+                self._due = 0
+                return []
+            self._due = min(self._due + len(self._order) * elapsed / self.interval, len(self._order))
+            due = []
+            for _ in range(int(self._due)):
+                self._next %= len(self._order)
+                due.append(self._order[self._next])
+                self._next += 1
+            self._due -= len(due)
+            return due
+
+    def poll_due(self, elapsed: float) -> Dict[int, List[Update]]:
+        """Polls the repositories that are due and returns the updates for each chat following them"""
+        batches: Dict[int, List[Update]] = {}
+        for repo in self.due(elapsed):
+            try:
+                updates = self.poll(repo)
+            except requests.RequestException as e:
+                logger.warning(f'Could not poll {repo.name}: {e}')
+                continue
+            if not updates:
+                continue
+            logger.info(f'{repo.name} has {len(updates)} updated branches')
+            with self._lock:
+                chat_ids = list(self._followers.get(repo, ()))
+            for chat_id in chat_ids:
+                batches.setdefault(chat_id, []).extend(updates)
+        return batches
+
+    def __contains__(self, repo: Repo):
+        return repo in self._followers
+
+    def __len__(self):
+        return len(self._order)
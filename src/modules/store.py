@@ -0,0 +1,243 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, time as daytime
+from typing import Iterable, List, Optional, Tuple
+
+from .openmensa import Canteen, Day, Meal, Price
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fetches (
+    key TEXT PRIMARY KEY,
+    start TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS canteens (
+    id PRIMARY KEY,
+    name TEXT NOT NULL,
+    city TEXT,
+    address TEXT,
+    latitude REAL,
+    longitude REAL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS days (
+    canteen_id NOT NULL,
+    date TEXT NOT NULL,
+    closed INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (canteen_id, date)
+);
+CREATE TABLE IF NOT EXISTS meals (
+    canteen_id NOT NULL,
+    date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT,
+    notes TEXT NOT NULL,
+    price_students REAL,
+    price_employees REAL,
+    image TEXT,
+    url TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (canteen_id, date, position)
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER NOT NULL,
+    canteen_id NOT NULL,
+    time TEXT NOT NULL,
+    PRIMARY KEY (chat_id, canteen_id)
+);
+CREATE TABLE IF NOT EXISTS watches (
+    chat_id INTEGER NOT NULL,
+    canteen_id NOT NULL,
+    PRIMARY KEY (chat_id, canteen_id)
+);
+'''
+
+
+class Store:
+    """ Keeps canteens, days and meals on disk together with the time they were fetched,
+    so a restarted bot does not have to fetch everything again. Also keeps the subscriptions of chats
+    and the canteens they watch for changes.
+    Every method writing to the store uses a single transaction.
+    """
+
+    def __init__(self, path: str, clock=time.time):
+        """
+        :param path: The sqlite database, created if it does not exist
+        :param clock: Returns the current time in seconds, used for the fetch timestamps
+        """
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            # readers do not block the writer and the other way around
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+        logger.info(f'Opened store {path}')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _fresh(self, key: str, max_age: float) -> Optional[tuple]:
+        row = self._connection.execute('SELECT start, fetched_at FROM fetches WHERE key = ?', (key,)).fetchone()
+        if row is None or self.clock() - row[1] > max_age:
+            return None
+        return row
+
+    def _fetched(self, key: str, now: float, start: Optional[str] = None):
+        self._connection.execute('INSERT OR REPLACE INTO fetches VALUES (?, ?, ?)', (key, start, now))
+
+    def put_canteens(self, canteens: Iterable[Canteen]):
+        """Replaces all canteens"""
+        now = self.clock()
+        rows = [(c.id, c.name, c.city, c.address,
+                 c.coordinates[0] if c.coordinates else None,
+                 c.coordinates[1] if c.coordinates else None, now) for c in canteens]
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM canteens')
+            self._connection.executemany('INSERT INTO canteens VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._fetched('canteens', now)
+
+    def canteens(self, max_age: float = float('inf')) -> Optional[List[Canteen]]:
+        """Returns all canteens or None if they were not fetched within max_age seconds"""
+        with self._lock:
+            if self._fresh('canteens', max_age) is None:
+                return None
+            rows = self._connection.execute(
+                'SELECT id, name, city, address, latitude, longitude FROM canteens ORDER BY rowid').fetchall()
+        return [Canteen(i, name, city, address, (lat, lng) if lat is not None else None)
+                for i, name, city, address, lat, lng in rows]
+
+    def put_days(self, canteen_id: int, days: Iterable[Day], start: date):
+        """Replaces the days of a canteen from start on"""
+        now = self.clock()
+        rows = [(canteen_id, d.date.isoformat(), d.closed, now) for d in days]
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM days WHERE canteen_id = ? AND date >= ?',
+                                     (canteen_id, start.isoformat()))
+            self._connection.executemany('INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?)', rows)
+            self._fetched(f'days/{canteen_id}', now, start.isoformat())
+
+    def put_day(self, canteen_id: int, day: Day):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?)',
+                                     (canteen_id, day.date.isoformat(), day.closed, self.clock()))
+
+    def days(self, canteen_id: int, start: date, max_age: float = float('inf')) -> Optional[List[Day]]:
+        """Returns the days of a canteen from start on or None if they were not fetched within max_age seconds"""
+        with self._lock:
+            fetch = self._fresh(f'days/{canteen_id}', max_age)
+            if fetch is None or fetch[0] > start.isoformat():
+                return None
+            rows = self._connection.execute(
+                'SELECT date, closed FROM days WHERE canteen_id = ? AND date >= ? ORDER BY date',
+                (canteen_id, start.isoformat())).fetchall()
+        return [Day(date.fromisoformat(d), bool(closed)) for d, closed in rows]
+
+    def day(self, canteen_id: int, day: date, max_age: float = float('inf')) -> Optional[Day]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT closed, fetched_at FROM days WHERE canteen_id = ? AND date = ?',
+                (canteen_id, day.isoformat())).fetchone()
+        if row is None or self.clock() - row[1] > max_age:
+            return None
+        return Day(day, bool(row[0]))
+
+    def put_meals(self, canteen_id: int, day: date, meals: Iterable[Meal]):
+        """Replaces the meals of a canteen on a day"""
+        now = self.clock()
+        rows = [(canteen_id, day.isoformat(), i, m.id, m.name, m.category, json.dumps(m.notes),
+                 m.prices.students, m.prices.employees, m.image, m.url, now) for i, m in enumerate(meals)]
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM meals WHERE canteen_id = ? AND date = ?',
+                                     (canteen_id, day.isoformat()))
+            self._connection.executemany('INSERT INTO meals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._fetched(f'meals/{canteen_id}/{day.isoformat()}', now)
+
+    def meals(self, canteen_id: int, day: date, max_age: float = float('inf')) -> Optional[List[Meal]]:
+        """Returns the meals of a canteen on a day or None if they were not fetched within max_age seconds"""
+        with self._lock:
+            if self._fresh(f'meals/{canteen_id}/{day.isoformat()}', max_age) is None:
+                return None
+            rows = self._connection.execute(
+                'SELECT id, name, category, notes, price_students, price_employees, image, url FROM meals '
+                'WHERE canteen_id = ? AND date = ? ORDER BY position', (canteen_id, day.isoformat())).fetchall()
+        return [Meal(i, name, category, tuple(json.loads(notes)), Price(students, employees), image, url)
+                for i, name, category, notes, students, employees, image, url in rows]
+
+    def prune(self, before: date):
+        """Removes days and meals before a date"""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM days WHERE date < ?', (before.isoformat(),))
+            self._connection.execute('DELETE FROM meals WHERE date < ?', (before.isoformat(),))
+            self._connection.execute("DELETE FROM fetches WHERE key LIKE 'meals/%' AND substr(key, -10) < ?",
+                                     (before.isoformat(),))
+
+    def subscribe(self, chat_id: int, canteen_id, at: daytime):
+        """Subscribes the chat to the daily menu of the canteen at a time of day, replaces an earlier time"""
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?)',
+                                     (chat_id, canteen_id, at.strftime('%H:%M')))
+
+    def unsubscribe(self, chat_id: int, canteen_id=None):
+        """Removes the subscription of the chat to a canteen or, without a canteen, all of its subscriptions"""
+        with self._lock, self._connection:
+            if canteen_id is None:
+                self._connection.execute('DELETE FROM subscriptions WHERE chat_id = ?', (chat_id,))
+            else:
+                self._connection.execute('DELETE FROM subscriptions WHERE chat_id = ? AND canteen_id = ?',
+                                         (chat_id, canteen_id))
+
+    def migrate_chat(self, old_chat_id: int, new_chat_id: int):
+        """Moves the subscriptions and watched canteens of a chat to its new id"""
+        with self._lock, self._connection:
+            for table in ('subscriptions', 'watches'):
+                self._connection.execute(f'UPDATE OR REPLACE {table} SET chat_id = ? WHERE chat_id = ?',
+                                         (new_chat_id, old_chat_id))
+
+    def forget_chat(self, chat_id: int):
+        """Removes the subscriptions and watched canteens of a chat"""
+        with self._lock, self._connection:
+            for table in ('subscriptions', 'watches'):
+                self._connection.execute(f'DELETE FROM {table} WHERE chat_id = ?', (chat_id,))
+
+    def subscriptions(self,
+                      at: Optional[daytime] = None,
+                      chat_id: Optional[int] = None) -> List[Tuple[int, str, daytime]]:
+        """Returns chat, canteen and time of all subscriptions, optionally only those at a time or of a chat"""
+        query = 'SELECT chat_id, canteen_id, time FROM subscriptions WHERE 1'
+        params = []
+        if at is not None:
+            query += ' AND time = ?'
+            params.append(at.strftime('%H:%M'))
+        if chat_id is not None:
+            query += ' AND chat_id = ?'
+            params.append(chat_id)
+        with self._lock:
+            rows = self._connection.execute(query + ' ORDER BY time, canteen_id', params).fetchall()
+        return [(chat, canteen, daytime.fromisoformat(t)) for chat, canteen, t in rows]
+
+    def watch(self, chat_id: int, canteen_id):
+        """Tells the chat about changes of the menu of the canteen"""
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO watches VALUES (?, ?)', (chat_id, canteen_id))
+
+    def unwatch(self, chat_id: int, canteen_id):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM watches WHERE chat_id = ? AND canteen_id = ?', (chat_id, canteen_id))
+
+    def watchers(self, canteen_id) -> List[int]:
+        """Returns the chats watching the menu of the canteen"""
+        with self._lock:
+            rows = self._connection.execute('SELECT chat_id FROM watches WHERE canteen_id = ? ORDER BY chat_id',
+                                            (canteen_id,)).fetchall()
+        return [chat_id for chat_id, in rows]
@@ -1,14 +1,86 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
 import requests
 
+from . import net
+
+logger = logging.getLogger(__name__)
+
+# seconds the result of a probe is shared with later callers
+result_ttl = 5
+
+
+class _Probe:
+    """A status check, shared by everyone asking for the same url at the same time"""
+    __slots__ = ('done', 'online', 'finished')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.online = False
+        self.finished: Optional[float] = None
+
+
+_probes: Dict[str, _Probe] = {}
+_lock = threading.Lock()
+# the last status each url had, used while the latency budget does not allow to probe
+_last: Dict[str, bool] = {}
+
 
 def check_status(url: str) -> bool:
-    """Check if url is online"""
-    r = requests.get(url)
+    """ Check if url is online.
+    Concurrent callers wait for the same request and its result is reused for result_ttl seconds.
+    If the latency budget runs out, the last known status is returned as stale and probed again in the background.
+    Callers waiting for someone else's probe also only wait as long as their budget allows.
+    """
+    with _lock:
+        probe = _probes.get(url)
+        owner = probe is None or (probe.finished is not None and time.monotonic() - probe.finished > result_ttl)
+        if owner:
+            probe = _probes[url] = _Probe()
+
+    if not owner:
+        # the probe may have been started without a budget
+        if not probe.done.wait(net.remaining()):
+            logger.warning(f'Using the last status of {url}, the running probe takes too long')
+            net.mark_stale()
+            return _last.get(url, False)
+        return probe.online
+
+    stale = False
+    try:
+        probe.online = _last[url] = _probe(url)
+    except net.BudgetExceeded as e:
+        logger.warning(f'Using the last status of {url}: {e}')
+        stale = True
+        probe.online = _last.get(url, False)
+        net.mark_stale()
+    finally:
+        # a stale status is not shared, the next caller probes again
+        probe.finished = time.monotonic() - (result_ttl if stale else 0)
+        probe.done.set()
+
+    if stale:
+        threading.Thread(target=check_status, args=(url,), daemon=True).start()
+    return probe.online
+
+
+def _probe(url: str) -> bool:
+    try:
+        # only the status code and the url after redirects are needed, so the body is never downloaded
+        with net.get(url, stream=True) as r:
+            status_code, url_new = r.status_code, r.url
+    except net.BudgetExceeded:
+        raise
+    except requests.RequestException as e:
+        logger.warning(f'{url} is not reachable: {e}')
+        return False
 
     # check status code
-    if r.status_code >= 500:
+    if status_code >= 500:
         return False
-    url_new = str(r)
 
     # check if there is the word offline in the current url, f.e. if it was redirected
     return "offline" not in url_new
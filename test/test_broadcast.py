@@ -0,0 +1,71 @@
+import time
+import unittest
+from unittest import mock
+
+from telegram.error import ChatMigrated, TimedOut, Unauthorized
+
+from src.modules import broadcast
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        now = 0.0
+        bucket = broadcast.TokenBucket(rate=2, capacity=2, clock=lambda: now)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1.0])
+
+        now = 10
+        self.assertEqual(bucket.reserve(), 0, 'The bucket should fill up while idle')
+
+
+class TestBroadcaster(unittest.TestCase):
+    def setUp(self) -> None:
+        self.bot = mock.Mock()
+        self.broadcaster = broadcast.Broadcaster(self.bot, rate=1000, chat_rate=1000, threads=2, backoff=0)
+        for hooks in ('on_blocked', 'on_migrated'):
+            patcher = mock.patch.object(broadcast, hooks, [])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [c.args for c in self.bot.send_message.call_args_list]
+
+    def test_in_order(self):
+        self.broadcaster.send(1, ['a', 'b', 'c'])
+        self.broadcaster.join()
+        self.assertEqual(self.sent(), [(1, 'a'), (1, 'b'), (1, 'c')])
+
+    def test_in_order_across_sends(self):
+        # the daily menu takes a while, the change notice sent after it should still arrive after it
+        self.bot.send_message.side_effect = lambda chat_id, text: time.sleep(0.1) if text == 'menu' else None
+        self.broadcaster.send(1, ['menu'])
+        self.broadcaster.send(1, ['change'])
+        self.broadcaster.join()
+        self.assertEqual(self.sent(), [(1, 'menu'), (1, 'change')])
+
+    def test_retry(self):
+        self.bot.send_message.side_effect = [TimedOut(), TimedOut(), None]
+        self.broadcaster.send(1, ['a'])
+        self.broadcaster.join()
+        self.assertEqual(self.sent(), [(1, 'a')] * 3)
+
+    def test_blocked(self):
+        blocked = mock.Mock()
+        broadcast.on_blocked.append(blocked)
+        self.bot.send_message.side_effect = Unauthorized('Forbidden: bot was blocked by the user')
+        self.broadcaster.send(1, ['a', 'b'])
+        self.broadcaster.join()
+        blocked.assert_called_once_with(1)
+        self.assertEqual(self.sent(), [(1, 'a')], 'Nothing more should be sent to a blocked chat')
+
+    def test_migrated(self):
+        migrated = mock.Mock()
+        broadcast.on_migrated.append(migrated)
+        self.bot.send_message.side_effect = [ChatMigrated(-100), None, None]
+        self.broadcaster.send(-1, ['a', 'b'])
+        self.broadcaster.join()
+        migrated.assert_called_once_with(-1, -100)
+        self.assertEqual(self.sent(), [(-1, 'a'), (-100, 'a'), (-100, 'b')])
+
+
+if __name__ == '__main__':
+    unittest.main()
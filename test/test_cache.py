@@ -0,0 +1,109 @@
+import unittest
+from unittest import mock
+
+from src.modules import openmensa
+from src.modules.cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_response(status_code=200, data=None, headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.ok = status_code < 400
+    response.headers = headers or {}
+    response.json.return_value = data
+    return response
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.cache = ResponseCache(maxsize=2, clock=self.clock)
+
+    def test_ttl(self):
+        entry = self.cache.put('a', 1, ttl=10)
+        self.assertTrue(self.cache.is_fresh(entry))
+        self.clock.now = 10
+        self.assertFalse(self.cache.is_fresh(entry), 'Entries should expire after the ttl')
+        self.assertIs(self.cache.get('a'), entry, 'Expired entries are kept for revalidation')
+
+        self.cache.touch('a', ttl=10)
+        self.assertTrue(self.cache.is_fresh(entry))
+
+    def test_lru_eviction(self):
+        self.cache.put('a', 1, ttl=10)
+        self.cache.put('b', 2, ttl=10)
+        self.cache.get('a')
+        self.cache.put('c', 3, ttl=10)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('b'), 'The least recently used entry should be evicted')
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def test_validators(self):
+        entry = self.cache.put('a', 1, ttl=10, etag='"x"', last_modified='yesterday')
+        self.assertEqual(entry.validators(), {'If-None-Match': '"x"', 'If-Modified-Since': 'yesterday'})
+
+
+class TestSendRequestCache(unittest.TestCase):
+    def setUp(self) -> None:
+        openmensa.url_canteen = 'https://example.org/openmensa/v2'
+        self.clock = FakeClock()
+        self.cache = ResponseCache(clock=self.clock)
+        patcher = mock.patch.object(openmensa, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(openmensa.net, 'get_async')
+    def test_fresh_entries_are_served_from_memory(self, get):
+        get.return_value = fake_response(data=[{'id': 1}])
+        url = openmensa.url_canteen + '/canteens'
+
+        first = openmensa.send_request(url, {'a': 1, 'b': 2})
+        first[0]['id'] = 2
+        second = openmensa.send_request(url, {'b': 2, 'a': 1})
+
+        self.assertEqual(get.call_count, 1, 'The second request should be answered from the cache')
+        self.assertEqual(second, [{'id': 1}], 'Changing a response must not change the cache')
+
+    @mock.patch.object(openmensa.net, 'get_async')
+    def test_stale_entries_are_revalidated(self, get):
+        url = openmensa.url_canteen + '/canteens/1/days/2021-04-01/meals'
+        get.return_value = fake_response(data=[{'id': 1}], headers={'ETag': '"v1"'})
+        openmensa.send_request(url)
+
+        self.clock.now = openmensa.get_ttl(url) + 1
+        get.return_value = fake_response(status_code=304)
+        self.assertEqual(openmensa.send_request(url), [{'id': 1}])
+        self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+
+        openmensa.send_request(url)
+        self.assertEqual(get.call_count, 2, 'A 304 should make the entry fresh again')
+
+    @mock.patch.object(openmensa.net, 'get_async')
+    def test_revalidating(self, get):
+        url = openmensa.url_canteen + '/canteens'
+        get.return_value = fake_response(data=[], headers={'ETag': '"v1"'})
+        openmensa.send_request(url)
+
+        get.return_value = fake_response(status_code=304)
+        with openmensa.revalidating():
+            openmensa.send_request(url)
+        self.assertEqual(get.call_count, 2, 'Fresh entries should be revalidated while prefetching')
+        self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+
+    def test_ttl_per_endpoint(self):
+        base = openmensa.url_canteen + '/canteens'
+        self.assertGreater(openmensa.get_ttl(base), openmensa.get_ttl(base + '/1/days'))
+        self.assertGreater(openmensa.get_ttl(base + '/1/days'), openmensa.get_ttl(base + '/1/days/2021-04-01/meals'))
+
+
+if __name__ == '__main__':
+    unittest.main()
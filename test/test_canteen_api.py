@@ -1,8 +1,25 @@
+import os
 import unittest
-from datetime import date
+from datetime import date, timedelta
 from src.modules import openmensa
+from bench.stub_openmensa import StubOpenMensa
 
-openmensa.url_canteen = 'https://api.studentenwerk-dresden.de/openmensa/v2'
+# set to https://api.studentenwerk-dresden.de/openmensa/v2 to test against the real api
+api_url = os.environ.get('OPENMENSA_URL')
+stub = None
+
+
+def setUpModule():
+    global stub
+    if api_url is None:
+        stub = StubOpenMensa().start()
+    openmensa.url_canteen = api_url or stub.url + '/openmensa/v2'
+    openmensa.cache.clear()
+
+
+def tearDownModule():
+    if stub is not None:
+        stub.stop()
 
 
 class TestCanteenApi(unittest.TestCase):
@@ -41,21 +58,30 @@ class TestCanteenApi(unittest.TestCase):
 
         for i in range(len(days)):
             d = days[i]
-            self.assertIsInstance(d['date'], date, 'Entry date should be of type datetime.date')
-            self.assertIsInstance(d['closed'], bool, 'Entry closed should be of type bool')
+            self.assertIsInstance(d.date, date, 'Entry date should be of type datetime.date')
+            self.assertIsInstance(d.closed, bool, 'Entry closed should be of type bool')
             if i < len(days) - 1:
-                self.assertTrue(d['date'] < days[i+1]['date'], 'The list should be sorted correctly')
+                self.assertTrue(d.date < days[i+1].date, 'The list should be sorted correctly')
 
         day = self.canteen.get_days(day=date.today())
-        self.assertIsInstance(day['date'], date, 'Entry date should be of type datetime.date')
-        self.assertIsInstance(day['closed'], bool, 'Entry closed should be of type bool')
+        self.assertIsInstance(day.date, date, 'Entry date should be of type datetime.date')
+        self.assertIsInstance(day.closed, bool, 'Entry closed should be of type bool')
+
+    def test_get_days_between(self):
+        start = date.today() + timedelta(days=1)
+        days = self.canteen.get_days_between(start, start + timedelta(days=6))
+        self.assertEqual([d.date for d in days], [start + timedelta(days=i) for i in range(7)])
+
+        menus = openmensa.get_menus(self.canteen, start, start + timedelta(days=6))
+        self.assertEqual([m.closed for m in menus], [d.closed for d in days])
+        self.assertTrue(all(m.meals for m in menus if not m.closed), 'Open days should have meals')
 
     def test_get_day(self):
         self.assertEqual(self.canteen.get_day(date.today()), self.canteen.get_days(day=date.today()))
 
     def test_get_next_day_opened(self):
         day = self.canteen.get_next_day_opened()
-        self.assertFalse(self.canteen.get_day(day)['closed'])
+        self.assertFalse(self.canteen.get_day(day).closed)
         self.assertTrue(day > date.today(), 'The next day opened should not be before today')
 
     def test_get_meals(self):
@@ -64,28 +90,20 @@ class TestCanteenApi(unittest.TestCase):
         self.assertIsInstance(meals, list, 'get_meals should return a list')
         self.assertTrue(len(meals) > 0, 'Meals list should not be empty.')
 
-        keys = ['id', 'name', 'notes', 'prices', 'category']
-        prices = ['Studierende', 'Bedienstete']
-
         for m in meals:
-            self.assertIsInstance(m, dict)
-
-            for k in keys:
-                self.assertTrue(k in m.keys(), f'Every meal should have a {k}')
-
-            self.assertIsInstance(m['notes'], list, 'Notes should be a list')
-            self.assertIsInstance(m['prices'], dict, 'Prices should be a dict')
-
-            for p in prices:
-                self.assertTrue(p in m['prices'], f'Prices should contain {p}')
+            self.assertIsInstance(m, openmensa.Meal)
+            self.assertIsInstance(m.notes, tuple, 'Notes should be a tuple')
+            self.assertIsInstance(m.prices, openmensa.Price, 'Prices should be a Price')
+            self.assertIsNotNone(m.prices.students, 'Prices should contain Studierende')
+            self.assertIsNotNone(m.prices.employees, 'Prices should contain Bedienstete')
 
-            self.assertTrue(m['image'].startswith('https://'), 'The url of the image is malformed.')
+            self.assertTrue(m.image.startswith('https://'), 'The url of the image is malformed.')
 
     def test_get_meal(self):
         day = self.canteen.get_next_day_opened()
         meals = self.canteen.get_meals(day)
         meal = meals[0]
-        self.assertEqual(self.canteen.get_meal(day, meal['id']), meal)
+        self.assertEqual(self.canteen.get_meal(day, meal.id), meal)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,36 @@
+import unittest
+from src.modules import openmensa
+
+
+class TestCanteenIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        names = ['Alte Mensa', 'Mensa Reichenbachstraße', 'Mensa Siedepunkt', 'Zeltschlösschen']
+        self.canteens = [openmensa.Canteen(str(i), name) for i, name in enumerate(names)]
+        self.index = openmensa.CanteenIndex(self.canteens)
+
+    def test_exact(self):
+        self.assertEqual(self.index.find('alte-mensa'), self.canteens[0])
+        self.assertEqual(self.index.find('Alte Mensa'), self.canteens[0])
+
+    def test_prefix(self):
+        self.assertEqual(self.index.find('zelt'), self.canteens[3])
+
+    def test_substring(self):
+        self.assertEqual(self.index.find('siedepunkt'), self.canteens[2])
+
+    def test_typo(self):
+        self.assertEqual(self.index.find('mensa-reichenbachstrase'), self.canteens[1])
+        self.assertEqual(self.index.find('siedepnkt'), self.canteens[2])
+
+    def test_no_match(self):
+        self.assertIsNone(self.index.find(''))
+        self.assertIsNone(self.index.find('xyz'))
+        self.assertIsNone(openmensa.CanteenIndex().find('alte-mensa'))
+
+    def test_listing(self):
+        self.assertEqual(self.index.listing.split('\n'),
+                         ['alte-mensa', 'mensa-reichenbachstrasse', 'mensa-siedepunkt', 'zeltschlösschen'])
+
+
+if __name__ == '__main__':
+    unittest.main()
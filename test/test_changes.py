@@ -0,0 +1,53 @@
+import unittest
+from datetime import date
+
+from src.modules import changes, menu, openmensa
+
+
+def meal(i: int, name: str, students: float, *notes: str) -> openmensa.Meal:
+    return openmensa.Meal(i, name, 'Pasta', notes, openmensa.Price(students, students + 2), None, None)
+
+
+class TestChanges(unittest.TestCase):
+    def setUp(self) -> None:
+        self.canteen = openmensa.Canteen('1', 'Alte Mensa')
+        self.day = date(2021, 4, 1)
+        self.before = (meal(1, 'Pasta', 2.5), meal(2, 'Suppe', 1.5), meal(3, 'Schnitzel', 3.5))
+        self.after = (meal(1, 'Pasta', 2.8), meal(2, 'Suppe', 1.5, 'ausverkauft'), meal(4, 'Curry', 3.0))
+
+    def test_diff(self):
+        menu_diff = changes.diff(self.canteen, self.day, self.before, self.after)
+        self.assertEqual(menu_diff.added, (self.after[2],))
+        self.assertEqual(menu_diff.removed, (self.before[2],))
+        self.assertEqual(menu_diff.price_changed, ((self.before[0], self.after[0]),))
+        self.assertEqual(menu_diff.sold_out, (self.after[1],))
+        self.assertFalse(changes.diff(self.canteen, self.day, self.before, self.before))
+
+    def test_detector(self):
+        detector = changes.ChangeDetector()
+        detector.observe(self.canteen, self.day, self.before)
+        detector.observe(self.canteen, self.day, tuple(self.before))
+        self.assertEqual(detector.take(), [], 'The first and unchanged menus should not be changes')
+
+        detector.observe(self.canteen, self.day, self.after)
+        detector.observe(self.canteen, self.day, self.after)
+        taken = detector.take()
+        self.assertEqual(len(taken), 1)
+        self.assertEqual(taken[0].added, (self.after[2],))
+        self.assertEqual(detector.take(), [])
+
+        detector.prune(date(2021, 4, 2))
+        self.assertEqual(len(detector), 0)
+
+    def test_render(self):
+        text = menu.render_changes(changes.diff(self.canteen, self.day, self.before, self.after))[0]
+        self.assertEqual(text, (
+            'Neues aus der <b>Alte Mensa</b> am Do 01.04.:\n\n'
+            '<b>Ausverkauft</b>\n• Suppe\n\n'
+            '<b>Neu</b>\n• Curry (3.00€ / 5.00€)\n\n'
+            '<b>Neuer Preis</b>\n• Pasta (2.50€ → 2.80€ / 4.50€ → 4.80€)\n\n'
+            '<b>Nicht mehr da</b>\n• Schnitzel'))
+
+
+if __name__ == '__main__':
+    unittest.main()
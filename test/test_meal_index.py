@@ -0,0 +1,52 @@
+import unittest
+from datetime import date
+from src.modules import openmensa
+
+
+def meal(i: int, name: str, category: str, *notes: str) -> openmensa.Meal:
+    return openmensa.Meal(i, name, category, notes, openmensa.Price(2.5, 4.2), None, None)
+
+
+class TestMealIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.alte_mensa = openmensa.Canteen('1', 'Alte Mensa')
+        self.siedepunkt = openmensa.Canteen('2', 'Mensa Siedepunkt')
+        self.monday, self.tuesday = date(2021, 4, 5), date(2021, 4, 6)
+        self.index = openmensa.MealIndex()
+        self.index.update(self.alte_mensa, self.monday, (
+            meal(1, 'Bandnudeln mit Tomatensoße', 'Pasta', 'vegan'),
+            meal(2, 'Schnitzel', 'Grill'),
+        ))
+        self.index.update(self.siedepunkt, self.tuesday, (
+            meal(3, 'Gemüsecurry', 'Wok', 'vegan', 'scharf'),
+        ))
+
+    def names(self, found):
+        return [m.name for _, _, m in found]
+
+    def test_search(self):
+        self.assertEqual(self.names(self.index.search('vegan')), ['Bandnudeln mit Tomatensoße', 'Gemüsecurry'])
+        self.assertEqual(self.names(self.index.search('pasta')), ['Bandnudeln mit Tomatensoße'])
+        self.assertEqual(self.names(self.index.search('nudel')), ['Bandnudeln mit Tomatensoße'])
+        self.assertEqual(self.names(self.index.search('Vegan Scharf')), ['Gemüsecurry'])
+        self.assertEqual(self.index.search('vegan schnitzel'), [])
+        self.assertEqual(self.index.search(''), [])
+
+    def test_days(self):
+        found = self.index.search('vegan', self.tuesday, self.tuesday)
+        self.assertEqual(found, [(self.siedepunkt, self.tuesday, meal(3, 'Gemüsecurry', 'Wok', 'vegan', 'scharf'))])
+
+    def test_update(self):
+        self.index.update(self.alte_mensa, self.monday, (meal(4, 'Spaghetti', 'Pasta', 'vegetarisch'),))
+        self.assertEqual(self.names(self.index.search('pasta')), ['Spaghetti'])
+        self.assertEqual(self.index.search('schnitzel'), [])
+        self.assertEqual(self.names(self.index.search('vegan')), ['Gemüsecurry'])
+
+    def test_prune(self):
+        self.index.prune(self.tuesday)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.search('nudel'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
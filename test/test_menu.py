@@ -0,0 +1,105 @@
+import asyncio
+import time
+import unittest
+from datetime import date
+from unittest import mock
+
+from src.modules import menu, openmensa
+
+
+def slow(result):
+    async def fetch(*_):
+        await asyncio.sleep(0.2)
+        return result
+    return fetch
+
+
+class TestGetMenu(unittest.TestCase):
+    def setUp(self) -> None:
+        self.canteen = openmensa.Canteen('1', 'Alte Mensa')
+        self.day = date(2021, 4, 1)
+        self.meals = [openmensa.Meal(1, 'Pasta', 'Pasta', (), openmensa.Price(2.5, 4.2), None, None)]
+
+    def test_fetches_concurrently(self):
+        with mock.patch.object(openmensa.Canteen, 'get_meals_async', slow(self.meals)), \
+                mock.patch.object(openmensa.Canteen, 'get_day_async', slow(openmensa.Day(self.day, False))), \
+                mock.patch.object(openmensa.Canteen, 'get_next_day_opened_async', slow(self.day)):
+            start = time.perf_counter()
+            menu = openmensa.get_menu(self.canteen, self.day)
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.5, 'Requests should be sent in parallel')
+        self.assertEqual(menu, openmensa.Menu(self.canteen, self.day, False, tuple(self.meals), self.day))
+
+    def test_menus_of_several_days(self):
+        days = [openmensa.Day(date(2021, 4, d), d == 3) for d in range(1, 5)]
+        with mock.patch.object(openmensa.Canteen, 'get_days_between_async', return_value=days) as get_days, \
+                mock.patch.object(openmensa.Canteen, 'get_meals_async',
+                                  mock.AsyncMock(side_effect=slow(self.meals))) as get_meals:
+            start = time.perf_counter()
+            menus = openmensa.get_menus(self.canteen, date(2021, 4, 1), date(2021, 4, 4))
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.5, 'Meals of all days should be requested in parallel')
+        get_days.assert_called_once_with(date(2021, 4, 1), date(2021, 4, 4))
+        self.assertEqual(get_meals.await_count, 3, 'The meals of closed days should not be requested')
+        self.assertEqual([m.day for m in menus], [d.date for d in days])
+        self.assertEqual(menus[2], openmensa.Menu(self.canteen, date(2021, 4, 3), True, (), date(2021, 4, 4)))
+        self.assertEqual(menus[0].meals, tuple(self.meals))
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self) -> None:
+        price = openmensa.Price(2.5, None)
+        meals = (
+            openmensa.Meal(1, 'Pasta & Pesto', 'Pasta', ('vegan',), price, menu.DEFAULT_IMAGE, 'https://example.org/1'),
+            openmensa.Meal(2, 'Suppe', 'Suppen', (), price, 'https://example.org/2.jpg', None),
+            openmensa.Meal(3, 'Lasagne', 'Pasta', (), price, None, None),
+        )
+        self.menu = openmensa.Menu(openmensa.Canteen('1', 'Alte Mensa'), date(2021, 4, 1), False, meals, None)
+
+    def test_render(self):
+        messages = menu.render(self.menu)
+        self.assertEqual(messages, (
+            'Am 01.04.2021 hat die <b>Alte Mensa</b>:\n\n'
+            '<b>Pasta</b>\n'
+            '• <a href="https://example.org/1">Pasta &amp; Pesto</a> (2.50€ / -)\n'
+            '• Lasagne (2.50€ / -)\n\n'
+            '<b>Suppen</b>\n'
+            '• Suppe (2.50€ / -)',
+        ))
+        self.assertIs(menu.render(self.menu), messages, 'Rendered menus should be cached')
+
+    def test_photos(self):
+        self.assertEqual(menu.photos(self.menu), (('https://example.org/2.jpg', 'Suppe'),))
+
+    def test_inline_results(self):
+        results = menu.inline_results(self.menu)
+        self.assertEqual([r.id for r in results], ['1-2021-04-01-menu', '1-2021-04-01-1', '1-2021-04-01-2', '1-2021-04-01-3'])
+        self.assertEqual(results[0].input_message_content.message_text, menu.render(self.menu)[0])
+        self.assertIs(menu.inline_results(self.menu), results, 'Results should be precomputed per menu')
+
+    def test_closed(self):
+        closed = openmensa.Menu(self.menu.canteen, self.menu.day, True, (), date(2021, 4, 6))
+        self.assertEqual(menu.render_closed(closed), 'Die Alte Mensa ist leider geschlossen. Sie öffnet wieder am 06.04.2021')
+        self.assertEqual([r.id for r in menu.inline_results(closed)], ['1-2021-04-01-closed'])
+
+    def test_render_days(self):
+        closed = openmensa.Menu(self.menu.canteen, date(2021, 4, 3), True, (), None)
+        self.assertEqual(menu.render_days((self.menu, closed)), (
+            'Die <b>Alte Mensa</b> hat:\n\n'
+            '<b>Do 01.04.</b>\n'
+            '• <a href="https://example.org/1">Pasta &amp; Pesto</a> (2.50€ / -)\n'
+            '• Suppe (2.50€ / -)\n'
+            '• Lasagne (2.50€ / -)\n\n'
+            'Geschlossen: Sa 03.04.',
+        ))
+
+    def test_split(self):
+        self.assertEqual(menu.split(['a' * 6, 'b' * 3, 'c\nd'], limit=10), ('a' * 6, 'b' * 3 + '\n\nc\nd'))
+        self.assertEqual(menu.split(['aaaa\nbbbb\ncccc'], limit=10), ('aaaa\nbbbb', 'cccc'))
+        self.assertEqual(menu.split(['a' * 25], limit=10), ('a' * 10, 'a' * 10, 'a' * 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
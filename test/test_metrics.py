@@ -0,0 +1,62 @@
+import unittest
+import urllib.request
+
+from src.modules import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_histogram(self):
+        for value in (0.001, 0.02, 0.02, 0.3, 20):
+            metrics.observe('handler_seconds', value, handler='command_canteen')
+        histogram = metrics.histograms()[('handler_seconds', (('handler', 'command_canteen'),))]
+        self.assertEqual(5, histogram.count)
+        self.assertEqual(0.025, histogram.quantile(0.5))
+        self.assertEqual(float('inf'), histogram.quantile(1))
+
+    def test_prometheus(self):
+        metrics.inc('telegram_errors_total', error='TimedOut')
+        metrics.inc('telegram_errors_total', error='TimedOut')
+        metrics.observe('upstream_seconds', 0.2, host='api.studentenwerk-dresden.de')
+        text = metrics.render_prometheus()
+        self.assertIn('telegram_errors_total{error="TimedOut"} 2', text)
+        self.assertIn('upstream_seconds_bucket{host="api.studentenwerk-dresden.de",le="0.25"} 1', text)
+        self.assertIn('upstream_seconds_bucket{host="api.studentenwerk-dresden.de",le="+Inf"} 1', text)
+        self.assertIn('upstream_seconds_count{host="api.studentenwerk-dresden.de"} 1', text)
+
+    def test_record_upstream(self):
+        metrics.record_upstream('https://api.studentenwerk-dresden.de/openmensa/v2/canteens', 200, 0.1)
+        metrics.record_upstream('https://bildungsportal.sachsen.de/opal/', None, 3)
+        counted = metrics.counters()
+        self.assertEqual(1, counted[('upstream_requests_total',
+                                     (('host', 'api.studentenwerk-dresden.de'), ('status', '200')))])
+        self.assertEqual(1, counted[('upstream_requests_total',
+                                     (('host', 'bildungsportal.sachsen.de'), ('status', 'error')))])
+
+    def test_profile_once(self):
+        metrics.profiles.pop('command_help', None)
+        with metrics.profiled('command_help'):
+            pass
+        self.assertNotIn('command_help', metrics.profiles)
+
+        metrics.profile_next('command_help')
+        with metrics.profiled('command_help'):
+            sum(range(1000))
+        self.assertIn('function calls', metrics.profiles.pop('command_help'))
+
+    def test_server(self):
+        metrics.inc('test_total')
+        server = metrics.start_server(0)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as r:
+                self.assertIn('test_total 1', r.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
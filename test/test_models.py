@@ -0,0 +1,48 @@
+import unittest
+from datetime import date
+from src.modules import openmensa
+
+
+class TestModels(unittest.TestCase):
+    def test_meal(self):
+        meal = openmensa.Meal.from_json({
+            'id': 1,
+            'name': 'Pasta',
+            'category': 'Pasta',
+            'notes': ['vegan'],
+            'prices': {'Studierende': 2.5, 'Bedienstete': 4.2},
+            'image': '//static.studentenwerk-dresden.de/pasta.jpg',
+            'url': 'https://www.studentenwerk-dresden.de/mensen/speiseplan/details-1.html'
+        })
+
+        self.assertEqual(meal.notes, ('vegan',))
+        self.assertEqual(meal.prices, openmensa.Price(2.5, 4.2))
+        self.assertEqual(meal.image, 'https://static.studentenwerk-dresden.de/pasta.jpg')
+        self.assertFalse(hasattr(meal, '__dict__'), 'Meals should not have a __dict__')
+        self.assertRaises(AttributeError, setattr, meal, 'name', 'Pizza')
+
+    def test_days(self):
+        days = openmensa.parse_days([
+            {'date': '2021-04-02', 'closed': True},
+            {'date': '2021-04-01', 'closed': False},
+        ])
+        self.assertEqual(days, (openmensa.Day(date(2021, 4, 1), False), openmensa.Day(date(2021, 4, 2), True)))
+
+        day = openmensa.Day.from_json({'day': '2021-04-01', 'closed': False})
+        self.assertEqual(day, days[0], 'Single days use the key day instead of date')
+
+    def test_canteens(self):
+        canteens = openmensa.parse_canteens([
+            {'id': 1, 'name': 'Alte Mensa', 'city': 'Dresden', 'address': 'Mommsenstr. 13',
+             'coordinates': [51.02696, 13.72659]},
+            {'id': 2, 'name': 'Mensa Siedepunkt', 'city': 'Dresden', 'address': 'Zellescher Weg 17',
+             'coordinates': None},
+        ])
+
+        self.assertEqual([c.id for c in canteens], [1, 2], 'All canteens should be converted')
+        self.assertEqual(canteens[0].coordinates, (51.02696, 13.72659))
+        self.assertFalse(canteens[1].has_coordinates())
+
+
+if __name__ == '__main__':
+    unittest.main()
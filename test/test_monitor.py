@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+
+from src.modules import monitor
+from src.modules.monitor import StatusMonitor
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.scheduled = []
+
+    def run_once(self, callback, when, name=None):
+        job = mock.Mock()
+        self.scheduled.append((callback, when, job))
+        return job
+
+    def run_next(self, bot):
+        callback, _, job = self.scheduled.pop(0)
+        callback(mock.Mock(job=job, job_queue=self, bot=bot))
+
+
+class TestStatusMonitor(unittest.TestCase):
+    def setUp(self) -> None:
+        self.online = False
+        self.probes = 0
+        self.jobs = FakeJobQueue()
+        self.bot = mock.Mock()
+        self.broadcaster = mock.Mock()
+        patcher = mock.patch.object(monitor.broadcast, 'shared', return_value=self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.monitor = StatusMonitor('opal', self.check, 'online', interval=10, max_interval=20, backoff=2)
+
+    def check(self):
+        self.probes += 1
+        return self.online
+
+    def test_one_probe_for_all_subscribers(self):
+        for chat_id in [1, 2, 2, 3]:
+            self.monitor.subscribe(self.jobs, chat_id)
+        self.assertEqual(len(self.jobs.scheduled), 1, 'There should only be one job')
+
+        self.jobs.run_next(self.bot)
+        self.assertEqual(self.probes, 1)
+        self.broadcaster.send.assert_not_called()
+
+        self.online = True
+        self.jobs.run_next(self.bot)
+        self.assertEqual(sorted(c.args for c in self.broadcaster.send.call_args_list),
+                         [(1, ['online']), (2, ['online']), (3, ['online'])],
+                         'Everyone should be told through the broadcaster')
+        self.assertFalse(self.monitor.running, 'The monitor should stop once the service is online')
+        self.assertEqual(self.jobs.scheduled, [])
+
+    def test_backoff(self):
+        self.monitor.subscribe(self.jobs, 1)
+        for _ in range(3):
+            self.jobs.run_next(self.bot)
+        self.assertEqual(self.jobs.scheduled[0][1], 20, 'The interval should grow up to max_interval')
+
+    def test_unsubscribe(self):
+        self.monitor.subscribe(self.jobs, 1)
+        self.monitor.unsubscribe(1)
+        self.assertFalse(self.monitor.running)
+        self.jobs.run_next(self.bot)
+        self.assertEqual(self.probes, 1)
+        self.assertEqual(self.jobs.scheduled, [], 'A stopped monitor should not reschedule itself')
+
+
+if __name__ == '__main__':
+    unittest.main()
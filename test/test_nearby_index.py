@@ -0,0 +1,49 @@
+import unittest
+from datetime import date
+from unittest import mock
+
+from src.modules import openmensa
+from src.modules.features import mensa
+
+
+class TestNearbyIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.alte_mensa = openmensa.Canteen('1', 'Alte Mensa', coordinates=(51.02696, 13.72652))
+        self.siedepunkt = openmensa.Canteen('2', 'Mensa Siedepunkt', coordinates=(51.02966, 13.73658))
+        self.zittau = openmensa.Canteen('3', 'Mensa Zittau', coordinates=(50.89130, 14.80603))
+        self.unknown = openmensa.Canteen('4', 'Mensa ohne Ort')
+        self.index = openmensa.NearbyIndex([self.alte_mensa, self.siedepunkt, self.zittau, self.unknown])
+
+    def test_distance(self):
+        self.assertAlmostEqual(openmensa.distance(self.alte_mensa.coordinates, self.siedepunkt.coordinates), 0.76, 2)
+
+    def test_nearest(self):
+        # close to the Siedepunkt
+        nearest = self.index.nearest((51.0290, 13.7350), k=2)
+        self.assertEqual([c for c, _ in nearest], [self.siedepunkt, self.alte_mensa])
+        self.assertLess(nearest[0][1], nearest[1][1])
+
+    def test_max_distance(self):
+        self.assertEqual([c for c, _ in self.index.nearest((51.0290, 13.7350), k=5)],
+                         [self.siedepunkt, self.alte_mensa])
+        self.assertEqual([c for c, _ in self.index.nearest((51.0290, 13.7350), k=5, max_distance=100)],
+                         [self.siedepunkt, self.alte_mensa, self.zittau])
+        self.assertEqual(len(self.index), 3, 'Canteens without coordinates can not be found by location')
+        self.assertEqual(openmensa.NearbyIndex().nearest((51.0290, 13.7350)), [])
+
+    def test_location_handler(self):
+        days = {self.alte_mensa: None, self.siedepunkt: openmensa.Day(date.today(), True)}
+        update = mock.Mock()
+        update.message.location.latitude, update.message.location.longitude = 51.0290, 13.7350
+        with mock.patch.object(openmensa, 'nearby_index', self.index), \
+                mock.patch.object(openmensa, 'canteen_index', openmensa.CanteenIndex([self.alte_mensa])), \
+                mock.patch.object(openmensa.Canteen, 'peek_day', lambda c, _: days.get(c)):
+            mensa.location_canteen(update, mock.Mock())
+
+        text = update.message.reply_text.call_args[0][0]
+        self.assertIn('Alte Mensa', text)
+        self.assertNotIn('Siedepunkt', text, 'Closed canteens should be left out')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+import unittest
+from datetime import date, time as daytime, timedelta
+from unittest import mock
+
+from bench.stub_openmensa import StubOpenMensa
+from src.modules import net, openmensa, url
+from src.modules.features import mensa
+from src.modules.store import Store
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.breaker = net.CircuitBreaker('example.org', threshold=2, reset_timeout=10, clock=lambda: self.now)
+
+    def test_opens(self):
+        self.breaker.failed()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failed()
+        self.assertFalse(self.breaker.allow(), 'The circuit should open after threshold failures')
+
+    def test_half_open(self):
+        self.breaker.failed()
+        self.breaker.failed()
+        self.now = 11
+        self.assertTrue(self.breaker.allow(), 'A single request should try again after reset_timeout')
+        self.assertFalse(self.breaker.allow())
+        self.breaker.failed()
+        self.assertFalse(self.breaker.allow(), 'A failed try should open the circuit again')
+
+        self.now = 22
+        self.assertTrue(self.breaker.allow())
+        self.breaker.succeeded()
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.open)
+
+
+class TestUpstreamOutage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stub = StubOpenMensa(canteens=2, meals=2).start()
+        self.addCleanup(self.stub.stop)
+        for patcher in (mock.patch.object(openmensa, 'url_canteen', self.stub.url + '/openmensa/v2'),
+                        mock.patch.object(openmensa, 'cache', openmensa.ResponseCache()),
+                        mock.patch.object(openmensa, 'store', None),
+                        mock.patch.dict(net.breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.canteen = openmensa.Canteen(1, 'Alte Mensa')
+        self.day = date.today()
+
+    def test_budget(self):
+        self.stub.latency = 1
+        start = time.perf_counter()
+        with net.budget(0.2), self.assertRaises(net.BudgetExceeded):
+            self.canteen.get_meals(self.day)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertFalse(net.breaker(self.stub.url).open, 'A slow host should not open the circuit')
+
+    def test_stale(self):
+        meals = self.canteen.get_meals(self.day)
+        key = openmensa.cache_key(self.canteen.url + f'/days/{self.day.isoformat()}/meals')
+        openmensa.cache.touch(key, -1)
+
+        self.stub.latency = 0.5
+        with net.tracking_freshness() as freshness, net.budget(0.1):
+            self.assertEqual(self.canteen.get_meals(self.day), meals)
+        self.assertTrue(freshness.stale, 'Meals that could not be refreshed should be stale')
+
+        # refreshed in the background
+        time.sleep(0.8)
+        self.assertTrue(openmensa.cache.is_fresh(openmensa.cache.get(key)))
+
+    def test_stale_not_stored(self):
+        now = 0
+        store = Store(':memory:', clock=lambda: now)
+        self.addCleanup(store.close)
+        ttl = openmensa.get_ttl(self.canteen.url + '/days/2021-04-01/meals')
+        with mock.patch.object(openmensa, 'store', store):
+            meals = self.canteen.get_meals(self.day)
+            key = openmensa.cache_key(self.canteen.url + f'/days/{self.day.isoformat()}/meals')
+            openmensa.cache.touch(key, -1)
+            now = ttl + 1
+
+            self.stub.latency = 0.5
+            with net.tracking_freshness() as freshness, net.budget(0.1):
+                self.assertEqual(self.canteen.get_meals(self.day), meals)
+            self.assertTrue(freshness.stale)
+            self.assertIsNone(store.meals(self.canteen.id, self.day, ttl), 'Stale meals should not be stored as fresh')
+
+            # refreshed in the background
+            time.sleep(1)
+            self.assertEqual(list(store.meals(self.canteen.id, self.day, ttl)), meals)
+
+    def test_joined_within_budget(self):
+        meals = self.canteen.get_meals(self.day)
+        key = openmensa.cache_key(self.canteen.url + f'/days/{self.day.isoformat()}/meals')
+        openmensa.cache.touch(key, -1)
+        calls = dict(self.stub.calls)
+
+        # a job without a budget starts the request, a handler joins it
+        self.stub.latency = 0.5
+        job = threading.Thread(target=self.canteen.get_meals, args=(self.day,))
+        job.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        with net.tracking_freshness() as freshness, net.budget(0.1):
+            self.assertEqual(self.canteen.get_meals(self.day), meals)
+        self.assertLess(time.perf_counter() - start, 0.3, 'Joining a request should stay within the budget')
+        self.assertTrue(freshness.stale)
+
+        job.join()
+        self.assertEqual(self.stub.calls['meals'] - calls['meals'], 1, 'The request should still be shared')
+        self.assertTrue(openmensa.cache.is_fresh(openmensa.cache.get(key)))
+
+    def test_joined_without_budget(self):
+        # a handler with a budget starts the request, a job without one joins it
+        self.stub.latency = 0.5
+        handler_errors = []
+
+        def handler():
+            try:
+                with net.budget(0.2):
+                    self.canteen.get_meals(self.day)
+            except net.BudgetExceeded as e:
+                handler_errors.append(e)
+
+        thread = threading.Thread(target=handler)
+        thread.start()
+        time.sleep(0.1)
+        meals = self.canteen.get_meals(self.day)
+        thread.join()
+        self.assertEqual(len(handler_errors), 1, 'The handler should give up after its budget')
+        self.assertEqual(self.stub.calls['meals'], 1, 'The request should be shared')
+        self.assertEqual(meals, self.canteen.get_meals(self.day))
+
+    def test_handlers_without_index(self):
+        store = Store(':memory:')
+        self.addCleanup(store.close)
+        store.subscribe(1, self.canteen.id, daytime(11, 0))
+        self.stub.stop()
+        for patcher in (mock.patch.object(openmensa, 'canteen_index', openmensa.CanteenIndex()),
+                        mock.patch.object(openmensa, 'nearby_index', openmensa.NearbyIndex()),
+                        mock.patch.object(openmensa, 'store', store),
+                        # the host is down, waiting for it would only slow the test down
+                        mock.patch.object(net, 'max_retries', 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        for handler, args in ((mensa.command_canteen, ['alte-mensa']), (mensa.command_subscribe, ['alte-mensa']),
+                              (mensa.command_watch, ['alte-mensa']), (mensa.location_canteen, [])):
+            with self.subTest(handler.__name__):
+                update = mock.MagicMock()
+                update.effective_chat.id = 2
+                handler(update, mock.Mock(args=args))
+                update.message.reply_text.assert_called_once_with(mensa.UNAVAILABLE)
+
+        update = mock.MagicMock()
+        update.effective_chat.id = 1
+        store.put_canteens([self.canteen])
+        mensa.command_subscribe(update, mock.Mock(args=[]))
+        self.assertIn('Alte Mensa um 11:00', update.message.reply_text.call_args[0][0],
+                      'The subscriptions should be listed without asking the api')
+
+        update = mock.MagicMock()
+        update.inline_query.query = 'alte-mensa'
+        mensa.inline_canteen(update, None)
+        update.inline_query.answer.assert_called_once_with([], cache_time=0)
+
+    def test_circuit_open(self):
+        self.stub.opal_status = 500
+        for _ in range(net.failure_threshold):
+            self.assertFalse(url._probe(self.stub.url + '/opal/'))
+        calls = self.stub.calls['opal']
+        with self.assertRaises(net.CircuitOpen):
+            net.get(self.stub.url + '/opal/')
+        self.assertEqual(self.stub.calls['opal'], calls, 'No request should be sent while the circuit is open')
+
+    def test_host_concurrency(self):
+        self.stub.latency = 0.2
+        days = [self.day + timedelta(days=i) for i in range(6)]
+
+        async def fetch_all():
+            return await asyncio.gather(*(self.canteen.get_meals_async(d) for d in days))
+
+        with mock.patch.object(net, 'host_concurrency', 2), mock.patch.dict(net._host_slots, clear=True):
+            start = time.perf_counter()
+            meals = net.run(fetch_all())
+            elapsed = time.perf_counter() - start
+        self.assertEqual(meals, [self.canteen.get_meals(d) for d in days])
+        self.assertGreaterEqual(elapsed, 0.6, 'At most two requests should be sent to the host at the same time')
+        self.assertLess(elapsed, 1.0, 'The requests should be sent two at a time')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import sys
+import unittest
+from unittest import mock
+
+from src.modules import plugins
+
+
+class TestPlugins(unittest.TestCase):
+    def setUp(self) -> None:
+        self.plugin = plugins.Plugin('test', '.features.opal', 'src.modules',
+                                     commands={'check_opal': 'command_opal'}, callback='button')
+        registry = mock.patch.dict(plugins.registry, {'test': self.plugin}, clear=True)
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_lazy_import(self):
+        sys.modules.pop('src.modules.features.opal', None)
+        callback = self.plugin.lazy('command_opal')
+        self.assertNotIn('src.modules.features.opal', sys.modules, 'Plugins should not be imported before their use')
+
+        with mock.patch('src.modules.url.check_status', return_value=True):
+            update = mock.Mock()
+            callback(update, mock.Mock())
+        self.assertTrue(self.plugin.loaded)
+        self.assertIn('test', plugins.import_times)
+        update.message.reply_text.assert_called_once_with('Opal ist zur Zeit online.')
+
+    def test_route_callback(self):
+        update = mock.Mock()
+        update.callback_query.data = plugins.callback_data('test', '0')
+        plugins.route_callback(update, mock.Mock())
+        update.callback_query.edit_message_text.assert_called_once_with(
+            text='Ich schicke keine Nachricht, wenn Opal wieder online ist.')
+
+        update.callback_query.data = '0'
+        plugins.route_callback(update, mock.Mock())
+        update.callback_query.edit_message_text.assert_called_with(text='Unknown button')
+
+    def test_help_text(self):
+        self.plugin.help = '/check_opal'
+        self.assertEqual(plugins.help_text(), '/check_opal')
+
+
+if __name__ == '__main__':
+    unittest.main()
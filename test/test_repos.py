@@ -0,0 +1,183 @@
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from telegram.ext import Updater
+
+from bench.fake_bot_api import FakeBotApi
+from src.modules import broadcast, net, plugins, repos
+from src.modules.features import repo_poll_interval
+from src.modules.features import repos as feature
+
+
+def git(*args: str, cwd: str) -> str:
+    return subprocess.run(['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.org', *args],
+                          cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+class GitHandler(BaseHTTPRequestHandler):
+    """Serves the files of a bare repository with an etag, like most web servers do"""
+    root = ''
+    statuses = []
+
+    def do_GET(self):
+        path = os.path.join(self.root, self.path.lstrip('/'))
+        if not os.path.isfile(path):
+            self.respond(404)
+            return
+        with open(path, 'rb') as file:
+            body = file.read()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.respond(304)
+            return
+        self.respond(200, body, etag)
+
+    def respond(self, status: int, body: bytes = b'', etag: str = None):
+        self.statuses.append(status)
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class TestRepoWatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.bare = os.path.join(directory.name, 'project.git')
+        self.work = os.path.join(directory.name, 'work')
+        git('init', '--bare', '-b', 'main', self.bare, cwd=directory.name)
+        git('clone', self.bare, self.work, cwd=directory.name)
+        self.commit('Initial commit')
+
+        handler = type('Handler', (GitHandler,), {'root': directory.name, 'statuses': []})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.statuses = handler.statuses
+
+        patcher = mock.patch.dict(net.breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.repo = repos.parse_repo(f'http://127.0.0.1:{self.server.server_port}/project.git')
+        self.watcher = repos.RepoWatcher(interval=60)
+
+    def commit(self, message: str, branch: str = 'main') -> str:
+        git('commit', '--allow-empty', '-m', message, cwd=self.work)
+        git('push', 'origin', f'HEAD:{branch}', cwd=self.work)
+        git('update-server-info', cwd=self.bare)
+        return git('rev-parse', 'HEAD', cwd=self.work)
+
+    def test_parse_repo(self):
+        self.assertIsInstance(repos.parse_repo('l0drex/TelegramInfoBot'), repos.GitHubRepo)
+        self.assertEqual(repos.parse_repo('https://github.com/l0drex/TelegramInfoBot.git').name,
+                         'l0drex/TelegramInfoBot')
+        self.assertIsInstance(self.repo, repos.GitRepo)
+        self.assertEqual(self.repo.name, 'project')
+        with self.assertRaises(ValueError):
+            repos.parse_repo('TelegramInfoBot')
+
+    def test_poll(self):
+        self.assertEqual(self.watcher.poll(self.repo), [], 'The first poll should only remember the branches')
+        before = git('rev-parse', 'HEAD', cwd=self.work)
+        self.assertEqual(self.watcher.poll(self.repo), [])
+        self.assertEqual(self.statuses, [200, 304], 'An unchanged repository should be revalidated')
+
+        after = self.commit('Second commit')
+        feature_head = self.commit('Feature', branch='feature')
+        updates = self.watcher.poll(self.repo)
+        self.assertCountEqual(updates, [
+            repos.Update(self.repo, 'main', before, after, ()),
+            repos.Update(self.repo, 'feature', None, feature_head, ())])
+
+    def test_batches(self):
+        other = repos.parse_repo(self.repo.url[:-len('/project.git/info/refs')] + '/work/.git')
+        git('update-server-info', cwd=self.work)
+        for chat_id in (1, 2):
+            self.watcher.follow(chat_id, self.repo)
+        self.watcher.follow(1, other)
+        self.assertEqual(len(self.watcher), 2)
+
+        self.assertEqual(self.watcher.poll_due(60), {})
+        self.commit('Second commit')
+        git('update-server-info', cwd=self.work)
+        batches = self.watcher.poll_due(60)
+        self.assertEqual(self.statuses.count(200), 4, 'Each repository should be polled once per interval')
+        self.assertEqual([u.repo for u in batches[1]], [self.repo, other], 'Updates should be sent once per chat')
+        self.assertEqual([u.repo for u in batches[2]], [self.repo])
+
+        self.watcher.unfollow(1)
+        self.assertEqual(self.watcher.following(1), [])
+        self.assertEqual(len(self.watcher), 1)
+
+    def test_due(self):
+        for i in range(4):
+            self.watcher.follow(1, repos.GitRepo(f'https://example.org/{i}.git'))
+        due = [len(self.watcher.due(5)) for _ in range(12)]
+        self.assertEqual(sum(due), 4, 'Every repository should be due once per interval')
+        self.assertEqual(due, [0, 0, 1] * 4, 'The polls should be spread evenly')
+
+    def test_persisted(self):
+        store = repos.FollowStore(':memory:')
+        self.addCleanup(store.close)
+        watcher = repos.RepoWatcher(store=store)
+        github = repos.parse_repo('https://github.com/l0drex/TelegramInfoBot')
+        watcher.follow(1, self.repo)
+        watcher.follow(1, github)
+        watcher.follow(2, github)
+        watcher.unfollow(2, repos.parse_repo('l0drex/TelegramInfoBot'))
+        watcher.migrate(1, 3)
+
+        restarted = repos.RepoWatcher(store=store)
+        self.assertEqual(restarted.following(3), [self.repo, github], 'Follows should survive a restart')
+        self.assertEqual(restarted.following(2), [])
+        watcher.unfollow(3)
+        self.assertEqual(store.follows(), [])
+
+    def test_poll_repos(self):
+        api = FakeBotApi().start()
+        self.addCleanup(api.stop)
+        updater = Updater(token='123:test', base_url=api.url)
+        watcher = repos.RepoWatcher(interval=repo_poll_interval)
+        patchers = [mock.patch.object(feature, 'watcher', watcher),
+                    mock.patch.object(broadcast, '_broadcaster', broadcast.Broadcaster(updater.bot))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        watcher.poll(self.repo)
+        watcher.follow(1, self.repo)
+        self.commit('Second commit')
+
+        # the job is scheduled like the plugin does and runs right away instead of after the interval
+        _, method, kwargs = plugins.registry['repos'].jobs[0]
+        job = getattr(updater.job_queue, method)(feature.poll_repos, **kwargs)
+        self.addCleanup(job.schedule_removal)
+        job.run(updater.dispatcher)
+        broadcast.shared(updater.bot).join()
+        self.assertEqual(len(api.sent.get('1', [])), 1, 'The job should tell the chat about the new commit')
+        self.assertIn('<b>project</b>', api.sent['1'][0])
+
+    def test_render(self):
+        commit = repos.Commit('0123456789', 'Fix <b>', 'Test', 'https://example.org/c')
+        text = feature.render([
+            repos.Update(repos.GitHubRepo('a', 'b'), repos.DEFAULT_BRANCH, 'abcdef0', '0123456789', (commit,)),
+            repos.Update(self.repo, 'feature', '0123456789', None, ())])[0]
+        self.assertEqual(text, (
+            'Neu in <b>a/b</b>:\n• <a href="https://example.org/c">0123456</a> Fix &lt;b&gt; (Test)\n\n'
+            '<b>project</b> (feature): Branch gelöscht'))
+
+
+if __name__ == '__main__':
+    unittest.main()
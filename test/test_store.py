@@ -0,0 +1,125 @@
+import threading
+import unittest
+from datetime import date, time
+from unittest import mock
+
+from src.modules import openmensa
+from src.modules.store import Store
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.store = Store(':memory:', clock=lambda: self.now)
+        self.addCleanup(self.store.close)
+        self.day = date(2021, 4, 1)
+        # responses are cached by their url
+        patcher = mock.patch.object(openmensa, 'url_canteen', 'https://example.org/openmensa/v2')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_canteens(self):
+        self.assertIsNone(self.store.canteens(), 'Canteens that were never fetched should be missing')
+
+        canteens = [openmensa.Canteen(1, 'Alte Mensa', 'Dresden', 'Mommsenstr. 13', (51.02696, 13.72659)),
+                    openmensa.Canteen(2, 'Mensa Siedepunkt')]
+        self.store.put_canteens(canteens)
+        stored = self.store.canteens(max_age=10)
+        self.assertEqual(stored, canteens)
+        self.assertEqual(stored[0].coordinates, (51.02696, 13.72659))
+        self.assertIsNone(stored[1].coordinates)
+
+        self.now = 11
+        self.assertIsNone(self.store.canteens(max_age=10), 'Outdated canteens should be missing')
+
+    def test_days(self):
+        days = [openmensa.Day(self.day, False), openmensa.Day(date(2021, 4, 2), True)]
+        self.store.put_days(1, days, start=self.day)
+
+        self.assertEqual(self.store.days(1, self.day), days)
+        self.assertEqual(self.store.days(1, date(2021, 4, 2)), days[1:])
+        self.assertIsNone(self.store.days(1, date(2021, 3, 31)), 'Days before the start were not fetched')
+        self.assertEqual(self.store.day(1, self.day), days[0])
+        self.assertIsNone(self.store.days(2, self.day))
+
+    def test_meals(self):
+        meals = [openmensa.Meal(2, 'Suppe', 'Suppen', ('vegan', 'scharf'), openmensa.Price(1.5, None), None, None),
+                 openmensa.Meal(1, 'Pasta', None, (), openmensa.Price(2.5, 4.2), 'https://example.org/1.jpg',
+                                'https://example.org/1')]
+        self.store.put_meals(1, self.day, meals)
+        self.assertEqual(self.store.meals(1, self.day), meals, 'Meals should keep their order')
+
+        self.store.put_meals(1, self.day, [])
+        self.assertEqual(self.store.meals(1, self.day), [], 'Fetched days without meals are not missing')
+
+        self.store.prune(date(2021, 4, 2))
+        self.assertIsNone(self.store.meals(1, self.day))
+
+    def test_read_through(self):
+        canteen = openmensa.Canteen(1, 'Alte Mensa')
+        meals = [openmensa.Meal(1, 'Pasta', None, (), openmensa.Price(2.5, 4.2), None, None)]
+        threads = set()
+
+        def recorded(method):
+            def wrapper(*args):
+                threads.add(threading.current_thread().name)
+                return method(*args)
+            return wrapper
+
+        with mock.patch.object(openmensa, 'store', self.store), \
+                mock.patch.object(self.store, 'meals', recorded(self.store.meals)), \
+                mock.patch.object(self.store, 'put_meals', recorded(self.store.put_meals)), \
+                mock.patch.object(openmensa, 'send_request_async', return_value=tuple(meals)) as send_request:
+            self.assertEqual(canteen.get_meals(self.day), meals)
+            self.assertEqual(canteen.get_meals(self.day), meals)
+        self.assertEqual(send_request.call_count, 1, 'The second call should be answered by the store')
+        self.assertTrue(threads)
+        self.assertNotIn('net-loop', threads, 'The store should not block the event loop')
+
+    def test_cached(self):
+        canteen = openmensa.Canteen(1, 'Alte Mensa')
+        meals = [openmensa.Meal(1, 'Pasta', None, (), openmensa.Price(2.5, 4.2), None, None)]
+        self.store.put_meals(1, self.day, meals)
+        cache = openmensa.ResponseCache()
+        with mock.patch.object(openmensa, 'store', self.store), mock.patch.object(openmensa, 'cache', cache), \
+                mock.patch.object(self.store, 'meals', wraps=self.store.meals) as load, \
+                mock.patch.object(openmensa, 'send_request_async') as send_request:
+            for _ in range(5):
+                self.assertEqual(canteen.get_meals(self.day), meals)
+        self.assertEqual(load.call_count, 1, 'Only the first call should need the store')
+        self.assertEqual(cache.hits, 4)
+        send_request.assert_not_called()
+
+    def test_subscriptions(self):
+        self.store.subscribe(1, 10, time(11, 0))
+        self.store.subscribe(2, 10, time(11, 0))
+        self.store.subscribe(2, 20, time(12, 30))
+        self.store.subscribe(1, 10, time(11, 30))
+        self.assertEqual(self.store.subscriptions(at=time(11, 0)), [(2, 10, time(11, 0))])
+        self.assertEqual(self.store.subscriptions(chat_id=2), [(2, 10, time(11, 0)), (2, 20, time(12, 30))])
+
+        self.store.migrate_chat(2, -2)
+        self.assertEqual(self.store.subscriptions(chat_id=2), [])
+        self.store.unsubscribe(-2, 10)
+        self.assertEqual(self.store.subscriptions(), [(1, 10, time(11, 30)), (-2, 20, time(12, 30))])
+        self.store.unsubscribe(1)
+        self.assertEqual(self.store.subscriptions(), [(-2, 20, time(12, 30))])
+
+    def test_watches(self):
+        self.store.watch(1, 10)
+        self.store.watch(1, 10)
+        self.store.watch(2, 10)
+        self.store.subscribe(2, 10, time(11, 0))
+        self.assertEqual(self.store.watchers(10), [1, 2])
+
+        self.store.migrate_chat(2, -2)
+        self.assertEqual(self.store.watchers(10), [-2, 1])
+        self.store.forget_chat(-2)
+        self.assertEqual(self.store.watchers(10), [1])
+        self.assertEqual(self.store.subscriptions(), [])
+        self.store.unwatch(1, 10)
+        self.assertEqual(self.store.watchers(10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.modules import url
+
+
+def fake_get(status_code=200, url_new='https://example.org/opal/'):
+    def get(*_, **__):
+        time.sleep(0.1)
+        response = mock.MagicMock()
+        response.__enter__.return_value = response
+        response.status_code = status_code
+        response.url = url_new
+        return response
+    return mock.Mock(side_effect=get)
+
+
+class TestCheckStatus(unittest.TestCase):
+    def setUp(self) -> None:
+        url._probes.clear()
+
+    def test_status(self):
+        cases = [
+            (fake_get(), True),
+            (fake_get(status_code=503), False),
+            (fake_get(url_new='https://example.org/opal/offline.html'), False),
+        ]
+        for get, online in cases:
+            url._probes.clear()
+            with self.subTest(online=online), mock.patch.object(url.net, 'get', get):
+                self.assertEqual(url.check_status('https://example.org/opal/'), online)
+                self.assertTrue(get.call_args.kwargs['stream'], 'The body should not be downloaded')
+
+    @mock.patch.object(url, 'result_ttl', 60)
+    def test_concurrent_callers_share_one_request(self):
+        get = fake_get()
+        results = []
+        with mock.patch.object(url.net, 'get', get):
+            threads = [threading.Thread(target=lambda: results.append(url.check_status('https://example.org/')))
+                       for _ in range(10)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            url.check_status('https://example.org/')
+
+        self.assertEqual(results, [True] * 10)
+        self.assertEqual(get.call_count, 1, 'Concurrent and following callers should share the result')
+
+    @mock.patch.object(url, 'result_ttl', 0)
+    def test_results_expire(self):
+        get = fake_get()
+        with mock.patch.object(url.net, 'get', get):
+            url.check_status('https://example.org/')
+            time.sleep(0.01)
+            url.check_status('https://example.org/')
+        self.assertEqual(get.call_count, 2)
+
+    def test_waiting_within_budget(self):
+        slow = mock.Mock(side_effect=lambda *_, **__: time.sleep(1) or fake_get()())
+        url._last['https://example.org/'] = True
+        self.addCleanup(url._last.clear)
+        with mock.patch.object(url.net, 'get', slow):
+            owner = threading.Thread(target=url.check_status, args=('https://example.org/',))
+            owner.start()
+            time.sleep(0.05)
+
+            start = time.perf_counter()
+            with url.net.tracking_freshness() as freshness, url.net.budget(0.2):
+                self.assertTrue(url.check_status('https://example.org/'))
+            self.assertLess(time.perf_counter() - start, 0.5, 'Joining a slow probe should not exceed the budget')
+            self.assertTrue(freshness.stale, 'The last known status should be stale')
+            owner.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+import urllib.request
+from types import SimpleNamespace
+from unittest import mock
+
+from telegram.ext import Defaults, Filters, MessageHandler, Updater
+
+from bench.fake_bot_api import FakeBotApi
+
+# main imports the modules like it does when it is run from src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import main  # noqa: E402
+
+
+def update(update_id: int) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': 'Hallo'}}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestWebhook(unittest.TestCase):
+    def setUp(self) -> None:
+        self.api = FakeBotApi().start()
+        self.addCleanup(self.api.stop)
+        self.handled = []
+        self._lock = threading.Lock()
+
+        updater = Updater(token='123:test', base_url=self.api.url, workers=2, defaults=Defaults(run_async=True))
+        updater.dispatcher.add_handler(MessageHandler(Filters.text, self.handle))
+        patcher = mock.patch.object(main, 'updater', updater)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, u, _):
+        time.sleep(0.005)
+        with self._lock:
+            self.handled.append(u.update_id)
+
+    def post(self, port: int, path: str, body: dict):
+        request = urllib.request.Request(f'http://127.0.0.1:{port}/{path}', json.dumps(body).encode(),
+                                         {'Content-Type': 'application/json'})
+        # the server starts in the background
+        for _ in range(50):
+            try:
+                return urllib.request.urlopen(request, timeout=1).status
+            except OSError:
+                time.sleep(0.05)
+        self.fail('The webhook did not start')
+
+    def test_pending_updates(self):
+        self.api.updates = [update(i) for i in range(1, 151)]
+        port = free_port()
+        main.start_webhook('127.0.0.1', port, 'geheim')
+        self.assertEqual(self.api.calls['getUpdates'], 3, 'Pending updates should be fetched in batches of 100')
+        self.assertEqual(self.api.updates, [], 'All pending updates should be confirmed')
+        self.assertEqual(self.api.calls['setWebhook'], 1)
+
+        self.assertEqual(self.post(port, 'geheim', update(151)), 200)
+        main.stop()
+        self.assertCountEqual(self.handled, range(1, 152), 'Stopping should wait for the queued updates')
+
+    def test_settings(self):
+        with self.assertRaises(ValueError, msg='The path keeps others from posting updates'):
+            main.webhook_settings(SimpleNamespace(webhook_url='https://example.org/geheim'))
+        with self.assertRaises(ValueError, msg='Telegram can not post to the local address'):
+            main.webhook_settings(SimpleNamespace(webhook_path='geheim'))
+        settings = main.webhook_settings(SimpleNamespace(webhook_path='geheim', bot_api_url='http://127.0.0.1/bot',
+                                                         webhook_port=8000))
+        self.assertEqual(settings, {'listen': '127.0.0.1', 'port': 8000, 'path': 'geheim', 'url': None})
+
+
+if __name__ == '__main__':
+    unittest.main()